@@ -0,0 +1,93 @@
+import csv
+import hashlib
+import json
+import os
+import numpy as np
+
+#what is stored for each ROC, in the order counted_roc returns them (through region_rocs)
+ROC_FIELDS = ['fpr', 'tpr', 'unc', 'band', 'auc', 'wp']
+#columns of the working point tables, one row per ROC and working point
+WP_COLUMNS = ['mistag_target', 'threshold', 'efficiency', 'mistag', 'efficiency_unc']
+
+def provenance_key(provenance):
+   'short hash identifying the inputs and options the ROCs were computed from'
+   return hashlib.sha1(json.dumps(provenance, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def artifact_path(outdir, provenance, kind='rocs'):
+   return os.path.join(outdir, '%s_%s.npz' % (kind, provenance_key(provenance)))
+
+def save_rocs(path, rocs, provenance):
+   '''stores the ROCs, keyed by (disc, region, signal, background), in a compressed
+   npz file together with the JSON provenance they were computed from'''
+   arrays = {'provenance' : np.array(json.dumps(provenance, sort_keys=True))}
+   for key, curves in rocs.items():
+      name = '/'.join(str(i) for i in key)
+      for field, values in zip(ROC_FIELDS, curves):
+         if values is not None:
+            arrays['%s/%s' % (name, field)] = values
+   np.savez_compressed(path, **arrays)
+
+def load_rocs(path):
+   'inverse of save_rocs, returns the ROCs and their provenance'
+   rocs = {}
+   with np.load(path) as artifact:
+      provenance = json.loads(str(artifact['provenance']))
+      for name in artifact.files:
+         if name == 'provenance':
+            continue
+         disc, region, signal, background, field = name.split('/')
+         key = (disc, region, int(signal), int(background))
+         rocs.setdefault(key, [None]*len(ROC_FIELDS))[ROC_FIELDS.index(field)] = artifact[name]
+   return dict((key, tuple(curves)) for key, curves in rocs.items()), provenance
+
+def save_shapes(path, shapes, edges):
+   '''stores the normalized score histograms, keyed by (disc, region, flavour),
+   in a compressed npz file together with their bin edges'''
+   arrays = dict(('/'.join(str(i) for i in key), values) for key, values in shapes.items())
+   arrays['edges'] = edges
+   np.savez_compressed(path, **arrays)
+
+def load_shapes(path):
+   'inverse of save_shapes, returns the histograms and their bin edges'
+   shapes = {}
+   with np.load(path) as artifact:
+      for name in artifact.files:
+         if name != 'edges':
+            disc, region, flavour = name.split('/')
+            shapes[disc, region, int(flavour)] = artifact[name]
+      return shapes, artifact['edges']
+
+def save_working_points(basename, rocs):
+   '''writes the working points of every ROC to basename.json and basename.csv,
+   nan (working point out of reach or no uncertainty computed) is written as null'''
+   rows = []
+   for key in sorted(rocs):
+      for values in rocs[key][ROC_FIELDS.index('wp')]:
+         row = dict(zip(['discriminator', 'region', 'signal', 'background'], key))
+         row.update((column, None if np.isnan(value) else float(value)) for column, value in zip(WP_COLUMNS, values))
+         rows.append(row)
+   columns = ['discriminator', 'region', 'signal', 'background'] + WP_COLUMNS
+   with open('%s.json' % basename, 'w') as output:
+      json.dump(rows, output, indent=2, sort_keys=True)
+   with open('%s.csv' % basename, 'w') as output:
+      writer = csv.DictWriter(output, columns)
+      writer.writeheader()
+      writer.writerows(rows)
+   return rows
+
+def load_manifest(directory):
+   '''state stored in directory: under files, the input files whose partial results
+   it holds, by path, with the cache_key of the file when it was processed and the
+   file of its partial, and under merged the file of the merge of all of them'''
+   path = os.path.join(directory, 'manifest.json')
+   if not os.path.isfile(path):
+      return {}
+   with open(path) as manifest:
+      return json.load(manifest)
+
+def save_manifest(directory, manifest):
+   'writes the manifest next to the partials, replacing the previous one only once complete'
+   path = os.path.join(directory, 'manifest.json')
+   with open(path + '.tmp', 'w') as output:
+      json.dump(manifest, output, indent=2, sort_keys=True)
+   os.rename(path + '.tmp', path)
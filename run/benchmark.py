@@ -0,0 +1,103 @@
+#! /bin/env python
+'''times each stage of make_rocs.py (read, select, roc, bootstrap, plot...) on synthetic
+trees of increasing size and records wall time, CPU time, throughput and peak
+memory as a JSON baseline, optionally comparing against a previous one'''
+import matplotlib
+matplotlib.use('Agg')
+
+import json
+import os
+import subprocess
+import sys
+from argparse import ArgumentParser, SUPPRESS
+from collections import OrderedDict
+from timing_utils import StageTimer
+from make_synthetic_tree import make_synthetic_tree
+import make_rocs
+
+def run_stages(infile, outdir, bootstrap=False, options=(), cache=False):
+   '''runs the make_rocs stages on infile, the same way make_rocs.py does for
+   these options, returns the StageTimer records. The tree is read directly
+   unless the cache is asked for, here or with --cache-dir in the options'''
+   options = list(options)
+   if bootstrap:
+      options.append('--bootstrap')
+   if not cache and not any(option.split('=')[0] in ('--cache-dir', '--no-cache') for option in options):
+      options.append('--no-cache')
+   args = make_rocs.prepare_args(make_rocs.parser.parse_args([infile, outdir] + options))
+   if not os.path.isdir(outdir):
+      os.makedirs(outdir)
+   timer = StageTimer()
+   rocs, shapes = make_rocs.run_rocs(args, timer)
+   make_rocs.plot_rocs(rocs, args, timer)
+   make_rocs.plot_shapes(shapes, args, timer)
+   return timer.stages
+
+def benchmark_size(njets, workdir, bootstrap, options, cache=False):
+   '''runs one size in a fresh process, so that the peak memory is that of this size only'''
+   infile = os.path.join(workdir, 'synthetic_%d.root' % njets)
+   if not os.path.isfile(infile):
+      make_synthetic_tree(infile, njets)
+   command = [sys.executable, os.path.abspath(__file__), '--single', infile, '--workdir', workdir]
+   if bootstrap:
+      command.append('--bootstrap')
+   if cache:
+      command.append('--cache')
+   if options:
+      #joined to the option name, a value starting with -- would be taken for an option
+      command.append('--options=%s' % ' '.join(options))
+   stages = json.loads(subprocess.check_output(command).splitlines()[-1], object_pairs_hook=OrderedDict)
+   for record in stages.values():
+      record['jets_per_second'] = njets / record['wall'] if record['wall'] else None
+   return stages
+
+def compare(results, baseline):
+   'prints the relative change of wall time and peak memory of every stage'
+   for size, stages in sorted(results.items(), key=lambda item: int(item[0])):
+      for name, record in stages.items():
+         reference = baseline.get(size, {}).get(name)
+         if not reference:
+            continue
+         print '%10s %-10s wall %+7.1f%%  peak RSS %+7.1f%%' % (
+            size, name,
+            100.*(record['wall'] / reference['wall'] - 1) if reference['wall'] else 0.,
+            100.*(record['peak_rss_mb'] / reference['peak_rss_mb'] - 1) if reference['peak_rss_mb'] else 0.,
+            )
+
+if __name__ == '__main__':
+   parser = ArgumentParser(description=__doc__)
+   parser.add_argument('--sizes', nargs='+', type=float, default=[1e5, 1e6],
+                       help='number of jets of the synthetic trees, e.g. 1e5 1e6 1e7 1e8')
+   parser.add_argument('--workdir', default='benchmark', help='where trees and plots are written')
+   parser.add_argument('--output', default='benchmark.json', help='JSON file the results are written to')
+   parser.add_argument('--baseline', help='JSON file of a previous run to compare with')
+   parser.add_argument('--bootstrap', action='store_true', help='also time the bootstrapped ROCs')
+   parser.add_argument('--cache', action='store_true',
+                       help='read the trees through their columnar cache, built by the first run of each size')
+   parser.add_argument('--options', default='',
+                       help='extra make_rocs.py options, e.g. "--jobs 4" or, for a single one, --options=--approx')
+   parser.add_argument('--single', help=SUPPRESS)
+   args = parser.parse_args()
+   options = args.options.split()
+
+   if args.single:
+      stages = run_stages(args.single, os.path.join(args.workdir, 'plots'), args.bootstrap, options, args.cache)
+      print json.dumps(stages)
+      sys.exit(0)
+
+   if not os.path.isdir(args.workdir):
+      os.makedirs(args.workdir)
+   results = {}
+   for size in args.sizes:
+      njets = int(size)
+      print 'benchmarking %d jets' % njets
+      results[str(njets)] = benchmark_size(njets, args.workdir, args.bootstrap, options, args.cache)
+      for name, record in results[str(njets)].items():
+         print '   %-10s %8.2f s wall %8.2f s CPU %12.0f jets/s %8.0f MB peak' % (
+            name, record['wall'], record['cpu'], record['jets_per_second'] or 0, record['peak_rss_mb'])
+
+   with open(args.output, 'w') as output:
+      json.dump(results, output, indent=2)
+   if args.baseline:
+      with open(args.baseline) as baseline:
+         compare(results, json.load(baseline))
@@ -0,0 +1,141 @@
+#! /bin/env python
+'''exact ROCs and AUCs of every flavour pair in bins of jet pt and |eta|, all the
+bins of a variable from a single lexsort of the selected jets by (bin, score) and
+segment-wise cumulative counts, instead of one selection and roc_curve per bin.
+Writes the AUC tables and one small-multiple plot per variable and pair'''
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+import csv
+import json
+import os
+import numpy as np
+from argparse import ArgumentParser
+from roc_utils import grouped_rocs, counts_roc, decimate_roc
+from tree_utils import expand_inputs, iterate_tree, default_cache_dir, ColumnAccumulator, needed_branches
+from plan_utils import Plan, DEFAULT_PLAN
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument('infiles', nargs='+',
+                    help='input trees: paths, glob patterns or .txt files listing one path per line')
+parser.add_argument('outdir')
+parser.add_argument('--plan', default=DEFAULT_PLAN, help='plan providing the selection, pairs and discriminators')
+parser.add_argument('--discriminators', nargs='+', help='discriminators to compare, by default all those of the plan')
+parser.add_argument('--region', help='plan region the jets are taken from, by default all the selected jets')
+parser.add_argument('--pt-bins', type=float, nargs='+', default=[30, 50, 100, 200, 400, 1000],
+                    help='edges of the jet pt bins')
+parser.add_argument('--eta-bins', type=float, nargs='+', default=[0, 0.8, 1.6, 2.4],
+                    help='edges of the jet |eta| bins')
+parser.add_argument('--max-memory', type=int, default=256,
+                    help='maximum size, in MB, of each chunk of the tree read at once')
+parser.add_argument('--cache-dir', help='directory of the columnar caches of the trees, by default next to each input when writable')
+parser.add_argument('--no-cache', action='store_true', help='always read the ROOT file, without caching it')
+
+#binned variables: name, label, option holding the bin edges and how they are computed from the columns
+VARIABLES = [
+   ('pt', 'jet $p_T$', 'pt_bins', lambda columns: columns['jet_pt']),
+   ('abseta', 'jet $|\\eta|$', 'eta_bins', lambda columns: np.abs(columns['jet_eta'])),
+   ]
+
+def read_jets(args):
+   'selected jets of every input file, with the binned variables'
+   mask = None if args.region is None else args.plan.mask_name(args.region)
+   names = ['flavour', 'jet_pt', 'jet_eta'] + args.discriminators + ([mask] if mask else [])
+   data = ColumnAccumulator(names, {'flavour' : np.uint8})
+   branches = needed_branches(args.plan.branches(args.discriminators), ['jet_pt', 'jet_eta'])
+   for infile in args.infiles:
+      cache_dir = None if args.no_cache else default_cache_dir(infile, args.cache_dir)
+      for chunk in iterate_tree(infile, branches=branches, max_memory=args.max_memory*2**20, cache_dir=cache_dir):
+         data.fill(chunk, args.plan.select(chunk))
+   columns = data.columns()
+   if mask:
+      columns = dict((name, values[columns[mask]]) for name, values in columns.items())
+   return columns
+
+def bin_rocs(columns, disc, edges, values, pairs):
+   'grouped_rocs of disc in the bins of values, jets outside the edges are dropped'
+   bins = np.searchsorted(edges, values, side='right') - 1
+   inside = (bins >= 0) & (bins < len(edges) - 1)
+   return grouped_rocs(bins[inside].astype(np.int32), columns[disc][inside], columns['flavour'][inside], pairs)
+
+def plot_bins(rocs, args, variable, label, edges, signal, background):
+   'one panel per bin with the ROC of every discriminator'
+   nbins = len(edges) - 1
+   ncols = min(nbins, 3)
+   nrows = (nbins + ncols - 1) // ncols
+   figure, axes = plt.subplots(nrows, ncols, figsize=(4*ncols, 4*nrows), sharex=True, sharey=True, squeeze=False)
+   for disc in args.discriminators:
+      ids, starts, thresholds, tps, fps, auc, auc_unc = rocs[disc][signal, background]
+      ends = np.r_[starts[1:], thresholds.size]
+      for index, group in enumerate(ids):
+         segment = slice(starts[index], ends[index])
+         fakes, eff, _ = counts_roc(thresholds[segment], tps[segment], fps[segment], drop_intermediate=True)
+         keep = decimate_roc(fakes, eff)
+         fakes, eff = fakes[keep], eff[keep]
+         axes.flat[group].plot(
+            eff, fakes, args.plan.discriminators[disc],
+            label='%s (AUC %.4f $\\pm$ %.4f)' % (disc, auc[index], auc_unc[index])
+            )
+   for group, ax in enumerate(axes.flat):
+      if group >= nbins:
+         ax.axis('off')
+         continue
+      ax.set_title('%g < %s < %g' % (edges[group], label, edges[group + 1]))
+      ax.set_yscale('log')
+      ax.set_ylim(5e-4, 1)
+      ax.set_xlim(0, 1)
+      ax.grid(which='both')
+      ax.legend(loc='best', fontsize='small')
+   for ax in axes[-1]:
+      ax.set_xlabel('Efficiency')
+   for ax in axes[:, 0]:
+      ax.set_ylabel('Mistag Rate')
+   figure.tight_layout()
+   name = '%s/binned_%s_%dvs%d' % (args.outdir, variable, signal, background)
+   figure.savefig('%s.png' % name)
+   figure.savefig('%s.pdf' % name)
+   plt.close(figure)
+
+if __name__ == '__main__':
+   args = parser.parse_args()
+   args.infiles = expand_inputs(args.infiles)
+   if not args.infiles:
+      parser.error('no input files found')
+   args.plan = Plan.load(args.plan)
+   args.discriminators = args.discriminators or list(args.plan.discriminators)
+   if args.region is not None and args.region not in args.plan.regions:
+      parser.error('unknown region %s, the plan has %s' % (args.region, ', '.join(args.plan.regions)))
+   if not os.path.isdir(args.outdir):
+      os.makedirs(args.outdir)
+
+   columns = read_jets(args)
+   rows = []
+   for variable, label, option, compute in VARIABLES:
+      edges = np.array(getattr(args, option))
+      values = compute(columns)
+      rocs = dict((disc, bin_rocs(columns, disc, edges, values, args.plan.pairs)) for disc in args.discriminators)
+      for signal, background in args.plan.pairs:
+         for disc in args.discriminators:
+            ids, starts, thresholds, tps, fps, auc, auc_unc = rocs[disc][signal, background]
+            ends = np.r_[starts[1:], thresholds.size] - 1
+            for index, group in enumerate(ids):
+               rows.append({
+                  'discriminator' : disc, 'variable' : variable, 'signal' : signal, 'background' : background,
+                  'bin_low' : float(edges[group]), 'bin_high' : float(edges[group + 1]),
+                  'n_signal' : int(tps[ends[index]]), 'n_background' : int(fps[ends[index]]),
+                  'auc' : None if np.isnan(auc[index]) else float(auc[index]),
+                  'auc_unc' : None if np.isnan(auc_unc[index]) else float(auc_unc[index]),
+                  })
+         plot_bins(rocs, args, variable, label, edges, signal, background)
+
+   fields = [
+      'discriminator', 'variable', 'bin_low', 'bin_high', 'signal', 'background',
+      'n_signal', 'n_background', 'auc', 'auc_unc',
+      ]
+   with open('%s/binned_aucs.json' % args.outdir, 'w') as output:
+      json.dump(rows, output, indent=2, sort_keys=True)
+   with open('%s/binned_aucs.csv' % args.outdir, 'w') as output:
+      writer = csv.DictWriter(output, fields)
+      writer.writeheader()
+      writer.writerows(rows)
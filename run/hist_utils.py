@@ -0,0 +1,132 @@
+import json
+import numpy as np
+from roc_utils import counts_roc, pair_counts
+
+class ScoreHistograms(object):
+   '''fine-binned histograms of each discriminator, per region and jet flavour,
+   filled in one pass over a stream of chunks and mergeable across chunks and files.
+   Each histogram has nbins uniform bins over [low, high], the last one including
+   high, plus an underflow bin, where the tagger default values end up, and an
+   overflow bin for the scores above high, as the score shapes count them.
+
+   The ROCs derived from them are exact at the bin edges, since the order of
+   the jets inside a bin is not known the true curve can only differ from the
+   approximate one within a bin: by at most the largest fraction of signal
+   (in efficiency) or background (in mistag rate) jets contained in a single bin,
+   which max_error returns'''
+   def __init__(self, discriminators, regions, flavours=(0, 4, 5), nbins=10**5, low=0., high=1.):
+      self.discriminators = list(discriminators)
+      self.regions = list(regions)
+      self.flavours = np.array(sorted(flavours))
+      self.nbins = nbins
+      self.low = low
+      self.high = high
+      self.counts = dict(
+         ((disc, region), np.zeros((self.flavours.size, nbins + 2), dtype=np.int64))
+         for disc in self.discriminators for region in self.regions
+         )
+
+   def bin_index(self, scores):
+      'histogram bin of each score, 0 is the underflow and nbins+1 the overflow'
+      #in float64 as bin_edges, float32 scores would be rounded to the wrong side of some edges
+      scores = np.asarray(scores, dtype=np.float64)
+      index = np.floor((scores - self.low) * (self.nbins / float(self.high - self.low)))
+      index = np.where(scores > self.high, self.nbins, np.clip(index, -1, self.nbins - 1))
+      return index.astype(np.int64) + 1
+
+   def fill(self, chunk, selected, regions):
+      '''adds the selected jets of the chunk, regions maps each region name to
+      a mask over the chunk or to None for all the selected jets'''
+      flavour = chunk['flavour'][selected]
+      iflavour = np.minimum(np.searchsorted(self.flavours, flavour), self.flavours.size - 1)
+      known = (self.flavours[iflavour] == flavour)
+      masks = dict(
+         (region, known if regions[region] is None else known & regions[region][selected])
+         for region in self.regions
+         )
+      size = self.flavours.size * (self.nbins + 2)
+      for disc in self.discriminators:
+         flat = iflavour * (self.nbins + 2) + self.bin_index(chunk[disc][selected])
+         for region in self.regions:
+            counts = np.bincount(flat[masks[region]], minlength=size)
+            self.counts[disc, region] += counts.reshape(self.flavours.size, self.nbins + 2)
+
+   def check_binning(self, other):
+      if (other.nbins, other.low, other.high) != (self.nbins, self.low, self.high) or \
+            not np.array_equal(other.flavours, self.flavours):
+         raise ValueError('cannot merge histograms with different binning or flavours')
+
+   def merge(self, other):
+      'adds the counts of other, which must have the same binning'
+      self.check_binning(other)
+      for key, counts in other.counts.items():
+         if key in self.counts:
+            self.counts[key] += counts
+         else:
+            self.counts[key] = counts.copy()
+      return self
+
+   def subtract(self, other):
+      'removes the counts of other, previously merged into these'
+      self.check_binning(other)
+      for key, counts in other.counts.items():
+         self.counts[key] -= counts
+      return self
+
+   def save(self, path):
+      'stores the counts and the binning in the compressed npz file path'
+      arrays = dict(('%s/%s' % key, counts) for key, counts in self.counts.items())
+      arrays['config'] = np.array(json.dumps({
+         'discriminators' : self.discriminators, 'regions' : self.regions,
+         'flavours' : self.flavours.tolist(), 'nbins' : self.nbins, 'low' : self.low, 'high' : self.high,
+         }))
+      np.savez_compressed(path, **arrays)
+
+   @classmethod
+   def load(cls, path):
+      'inverse of save'
+      with np.load(path) as stored:
+         histograms = cls(**json.loads(str(stored['config'])))
+         for key in histograms.counts:
+            histograms.counts[key] = stored['%s/%s' % key]
+      return histograms
+
+   def flavour_counts(self, disc, region, flavour):
+      return self.counts[disc, region][np.searchsorted(self.flavours, flavour)]
+
+   def bin_edges(self):
+      '''lower edge of each bin, -inf for the underflow and the smallest value above
+      high for the overflow, which flavour_shapes then leaves out of every bin'''
+      edges = self.low + (np.arange(self.nbins + 2) - 1) * (self.high - self.low) / float(self.nbins)
+      edges[0] = -np.inf
+      edges[-1] = np.nextafter(self.high, np.inf)
+      return edges
+
+   def region_counts(self, disc, region):
+      '''lower bin edges, by decreasing value, and the cumulative count of each flavour
+      above each of them, the reverse cumulative sums of the histograms'''
+      return self.bin_edges()[::-1], dict(
+         (flav, np.cumsum(self.flavour_counts(disc, region, flav)[::-1]))
+         for flav in self.flavours
+         )
+
+   def threshold_counts(self, disc, region, signal, background):
+      '''lower bin edges, by decreasing value, and the cumulative signal and background
+      counts above each of them. Edges of empty bins do not add any threshold'''
+      return pair_counts(*self.region_counts(disc, region), signal=signal, background=background)
+
+   def roc(self, disc, region, signal, background):
+      '''fpr, tpr and thresholds (lower bin edges, decreasing) as roc_curve returns them'''
+      return counts_roc(*self.threshold_counts(disc, region, signal, background))
+
+   def max_error(self, disc, region, signal, background):
+      '''largest possible deviation of the approximate efficiency and mistag rate
+      from the exact ones, the largest signal and background fractions in one bin.
+      The underflow and overflow bins are taken to hold only tagger default values,
+      which are single thresholds also in the exact ROC'''
+      sig = self.flavour_counts(disc, region, signal)
+      bkg = self.flavour_counts(disc, region, background)
+      return (
+         sig[1:-1].max() / float(max(sig.sum(), 1)),
+         bkg[1:-1].max() / float(max(bkg.sum(), 1)),
+         )
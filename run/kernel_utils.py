@@ -0,0 +1,113 @@
+'''inner loops of the ROC and bootstrap computations. Each kernel is written once
+as an explicit loop, compiled by numba when it is installed, and once with NumPy
+array operations, used otherwise or when numba cannot compile it. Both give bit
+for bit the same results, which tests/test_kernel_utils.py checks'''
+import numpy as np
+try:
+   import numba
+except ImportError:
+   numba = None
+else:
+   try:
+      from numba.core.errors import NumbaError
+   except ImportError:
+      from numba.errors import NumbaError
+
+def _run_ends_loop(values):
+   ends = np.empty(values.size, dtype=np.int64)
+   count = 0
+   for i in range(values.size - 1):
+      if values[i + 1] != values[i]:
+         ends[count] = i
+         count += 1
+   if values.size:
+      ends[count] = values.size - 1
+      count += 1
+   return ends[:count]
+
+def _run_ends_numpy(values):
+   if not values.size:
+      return np.empty(0, dtype=np.int64)
+   return np.r_[np.where(values[1:] != values[:-1])[0], values.size - 1].astype(np.int64)
+
+def _weighted_counts_loop(y_true, thresholds, weights):
+   tps = np.empty(thresholds.size, dtype=weights.dtype)
+   fps = np.empty(thresholds.size, dtype=weights.dtype)
+   #running sums kept in the dtype of the weights, as np.cumsum does
+   total = np.zeros(2, dtype=weights.dtype)
+   j = 0
+   for i in range(y_true.size):
+      if j == thresholds.size:
+         break
+      if y_true[i]:
+         total[0] += weights[i]
+      else:
+         total[1] += weights[i]
+      if i == thresholds[j]:
+         tps[j] = total[0]
+         fps[j] = total[1]
+         j += 1
+   return tps, fps
+
+def _weighted_counts_numpy(y_true, thresholds, weights):
+   zero = np.zeros(1, dtype=weights.dtype)
+   tps = np.cumsum(np.where(y_true, weights, zero))[thresholds]
+   fps = np.cumsum(np.where(y_true, zero, weights))[thresholds]
+   return tps, fps
+
+def _grid_segments_loop(x, grid):
+   first = np.empty(grid.size, dtype=np.int64)
+   second = np.empty(grid.size, dtype=np.int64)
+   for k in range(grid.size):
+      j = np.searchsorted(x, grid[k], side='right')
+      if j == 0:
+         j = np.searchsorted(x, x[0], side='right')
+      elif j == x.size:
+         j = np.searchsorted(x, x[x.size - 1], side='left')
+      second[k] = j
+      first[k] = np.searchsorted(x, x[j - 1], side='left')
+   return first, second
+
+def _grid_segments_numpy(x, grid):
+   second = np.searchsorted(x, grid, side='right')
+   second = np.where(second == 0, np.searchsorted(x, x[0], side='right'), second)
+   second = np.where(second == x.size, np.searchsorted(x, x[-1], side='left'), second)
+   return np.searchsorted(x, x[second - 1], side='left'), second
+
+if numba is not None:
+   _run_ends_loop = numba.njit(cache=True)(_run_ends_loop)
+   _weighted_counts_loop = numba.njit(cache=True)(_weighted_counts_loop)
+   _grid_segments_loop = numba.njit(cache=True)(_grid_segments_loop)
+
+#loops numba failed to compile, run by their NumPy version from then on
+_failed = set()
+
+def run_kernel(loop, vectorized, *args):
+   '''the loop, compiled by numba on its first call, or the NumPy version without
+   numba or when the loop cannot be compiled for these arguments'''
+   if numba is not None and loop not in _failed:
+      try:
+         return loop(*args)
+      except NumbaError as error:
+         print 'numba cannot compile %s, using NumPy instead: %s' % (getattr(loop, '__name__', loop), error)
+         _failed.add(loop)
+   return vectorized(*args)
+
+def run_ends(values):
+   '''position of the last element of each run of equal values, e.g. of each
+   distinct threshold of sorted scores'''
+   return run_kernel(_run_ends_loop, _run_ends_numpy, np.asarray(values))
+
+def weighted_counts(y_true, thresholds, weights):
+   '''cumulative weights of the signal (tps) and background (fps) jets of a sorted
+   sample up to each of the thresholds positions, in one pass without temporaries'''
+   y_true, thresholds, weights = np.asarray(y_true, dtype=bool), np.asarray(thresholds), np.asarray(weights)
+   return run_kernel(_weighted_counts_loop, _weighted_counts_numpy, y_true, thresholds, weights)
+
+def grid_segments(x, grid):
+   '''ends of the segment of the curve sampled at x (non-decreasing, with at least
+   two distinct values) that linearly interpolates each grid point, the first
+   and last segments extrapolating beyond the curve like a k=1 spline. Of the
+   points sharing an x the first one is used, as drop_duplicates does, without
+   removing the others: the cost is O(log(x.size)) per grid point'''
+   return run_kernel(_grid_segments_loop, _grid_segments_numpy, np.asarray(x), np.asarray(grid, dtype=float))
@@ -3,122 +3,416 @@ import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
-import root_numpy
-import pandas as pd
 import numpy as np
-from sklearn.metrics import roc_curve
-from scipy.interpolate import InterpolatedUnivariateSpline
 from pdb import set_trace
 from argparse import ArgumentParser
 import os
+import sys
+from roc_utils import region_rocs, pair_replicas, counted_roc, flavour_shapes, sort_scores, bootstrap_replicas, decimate_roc, WORKING_POINTS, SHAPE_EDGES, ScoreRuns
+from tree_utils import TREE_NAME, expand_inputs, iterate_tree, cache_key, default_cache_dir, ColumnAccumulator
+from selection_utils import MaskIndex
+from pool_utils import TaskPool
+from artifact_utils import artifact_path, provenance_key, save_rocs, load_rocs, save_working_points, \
+   load_manifest, save_manifest, save_shapes, load_shapes
+from timing_utils import StageTimer
+from hist_utils import ScoreHistograms
+from plan_utils import Plan, DEFAULT_PLAN
+
+#names of the jet flavours in the shape plots
+FLAVOUR_LABELS = {5 : 'b', 4 : 'c', 0 : 'udsg'}
+#replicas of each bootstrapped ROC
+BOOTSTRAP_REPLICAS = 200
 
 parser = ArgumentParser()
-parser.add_argument('infile')
+parser.add_argument('infiles', nargs='+',
+                    help='input trees: paths, glob patterns or .txt files listing one path per line')
 parser.add_argument('outdir')
 parser.add_argument("--bootstrap", action='store_true')
-args = parser.parse_args()
-
-if not os.path.isdir(args.outdir):
-   os.makedirs(args.outdir)
-
-def bootstrapped_roc(true, pred, n_boots=200):
-   'from https://stackoverflow.com/questions/19124239/scikit-learn-roc-curve-with-confidence-intervals'
-   y_true = true.as_matrix()
-   y_pred = pred.as_matrix()
-   newx = np.logspace(-4, 0, 80)
-   tprs = pd.DataFrame()
-   for iboot in range(n_boots):
-      idxs = np.random.random_integers(0, y_pred.shape[0] - 1, y_pred.shape[0])
-      fakes, effs, _ = roc_curve(y_true[idxs], y_pred[idxs])
-      #remove duplicates in the ROC
-      coords = pd.DataFrame()
-      coords['fpr'] = fakes
-      coords['tpr'] = effs
-      clean = coords.drop_duplicates(subset=['fpr'])
-      #fit with a spline
-      spline = InterpolatedUnivariateSpline(clean.fpr, clean.tpr,k=1)
-      #make uniform spacing to allow averaging
-      tprs[iboot] = spline(newx)
-   return newx, tprs.mean(axis=1), tprs.std(axis=1)
-
-data = pd.DataFrame(
-   root_numpy.root2array(
-      args.infile,
-      #'TTBar_RelVal.root', #'TTBar.root', 
-      'bTaggingExerciseIIAK4Jets/tree')
-   )
-data = data[(data.jet_pt > 30) & (np.abs(data.jet_eta) < 2.4)]
-
-HEM_15_16 = data[(data.jet_eta < -1.5) & \
-                    (data.jet_eta > -2.5) & \
-                    (data.jet_phi < -0.6) & \
-                    (data.jet_phi > -1.8)]
-
-safe_data = data[(data.jet_eta > 1.5) & \
-                    (data.jet_eta < 2.5)]
-
-for what, bkg in [('BvsL', 0), ('BvsC', 4)]:
-   print what
-   for disc, color in [('CSVv2', 'r'), ('DeepCSV', 'g'), ('DeepFlavour', 'b')]:
-      print ' ',disc
-      flav_mask = (HEM_15_16.flavour == 5) | (HEM_15_16.flavour == bkg)
-      truth = (HEM_15_16[flav_mask].flavour == 5).astype(float)
-      prediction = HEM_15_16[flav_mask][disc]
-      if args.bootstrap:
-         fakes, eff, unc = bootstrapped_roc(truth, prediction)
-         plt.fill_betweenx(fakes, eff-unc, eff+unc, color=color, alpha=0.3)
-      else:
-         fakes, eff, _ = roc_curve(truth, prediction)
-      plt.plot(eff, fakes, color, label='%s HEM 15-16' % disc)
-      
-      flav_mask = (safe_data.flavour == 5) | (safe_data.flavour == bkg)
-      truth = (safe_data[flav_mask].flavour == 5).astype(float)
-      prediction = safe_data[flav_mask][disc]
-      fakes, eff, _ = roc_curve(truth, prediction)
-      plt.plot(eff, fakes, color+'--', label='%s FWD' % disc)
-   plt.ylabel('Mistag Rate')
-   plt.xlabel('Efficiency')
-   plt.legend(loc='best')
-   plt.ylim(5e-4, 1)
-   plt.gca().set_yscale('log')
-   plt.grid(which='both')
-   plt.xlim(0,1)
-   plt.savefig('%s/%s.png' % (args.outdir, what))
-   plt.savefig('%s/%s.pdf' % (args.outdir, what))
-   plt.clf()
-
-
-
-for disc, color in [('CSVv2', 'r'), ('DeepCSV', 'g'), ('DeepFlavour', 'b')]:
-   disc_mask = np.ones(data.shape[0]).astype(bool) #(data[disc] >= 0)
-   print disc
-   flav_mask = (data.flavour == 5) | (data.flavour == 0)
-   truth = (data[flav_mask & disc_mask].flavour == 5).astype(float)
-   prediction = data[flav_mask & disc_mask][disc]
-   if args.bootstrap:
-      fakes, eff, unc = bootstrapped_roc(truth, prediction)
-      plt.fill_betweenx(fakes, eff-unc, eff+unc, color=color, alpha=0.3)
+parser.add_argument("--bootstrap-weights", default='multinomial', choices=['multinomial', 'poisson'],
+                    help='replica weights, multinomial is equivalent to resampling with replacement')
+parser.add_argument("--analytic", action='store_true',
+                    help='binomial efficiency bands and DeLong AUC uncertainties instead of the bootstrap, for every ROC')
+parser.add_argument("--interval", default='wilson', choices=['wilson', 'clopper-pearson'],
+                    help='binomial interval of --analytic')
+parser.add_argument("--band", default='std', choices=['std', 'quantile'],
+                    help='band drawn: mean +/- one standard deviation or the 16%%-84%% quantiles (binomial interval with --analytic)')
+parser.add_argument("--fpr-grid", type=float, nargs=3, metavar=('MIN', 'MAX', 'POINTS'),
+                    help='log-spaced mistag rates the bootstrap and analytic bands are computed at, by default 1e-4 1 80')
+parser.add_argument("--mistags", nargs='+', type=float, default=list(WORKING_POINTS),
+                    help='mistag rates of the working points written to OUTDIR/working_points.json and .csv')
+parser.add_argument("--plan", default=DEFAULT_PLAN,
+                    help='JSON (or YAML) file listing the selection, regions, flavour pairs, discriminators and plots')
+parser.add_argument("--discriminators", nargs='+', help='discriminators to plot, by default all those of the plan')
+parser.add_argument("--max-memory", type=int, default=256,
+                    help='maximum size, in MB, of each chunk of the tree read at once')
+parser.add_argument("--cache-dir", help='directory of the columnar caches of the trees, by default next to each input when writable')
+parser.add_argument("--no-cache", action='store_true', help='always read the ROOT file, without caching it')
+parser.add_argument("--replot", action='store_true',
+                    help='only redraw the plots from the ROCs stored in OUTDIR by a previous run with the same options')
+parser.add_argument("--max-points", type=int, default=2000,
+                    help='maximum number of points drawn per ROC curve, 0 to draw them all')
+parser.add_argument("--max-deviation", type=float, default=1e-3,
+                    help='maximum distance of the dropped ROC points from the drawn curve, in units of the axes ranges')
+parser.add_argument("--approx", action='store_true',
+                    help='compute the ROCs from fine-binned score histograms, in a single pass and constant memory')
+parser.add_argument("--bins", type=int, default=10**5, help='number of score bins of --approx')
+parser.add_argument("--incremental", action='store_true',
+                    help='keep the partial result of every input file in OUTDIR and only process the files new or changed since the previous run')
+parser.add_argument("--jobs", type=int, default=1,
+                    help='number of worker processes computing the ROCs, or reading the files if more than one')
+
+def read_branches(args):
+   return args.plan.branches(args.discriminators)
+
+def read_chunks(args, infile):
+   cache_dir = None if args.no_cache else default_cache_dir(infile, args.cache_dir)
+   return iterate_tree(
+      infile, branches=read_branches(args),
+      max_memory=args.max_memory*2**20, cache_dir=cache_dir
+      )
+
+def read_data(args, timer):
+   '''reads the tree in chunks, keeping only the selected jets and the
+   columns needed by the ROCs, so that memory does not scale with the file'''
+   #hadron flavours fit in a byte, scores stay float32 and masks bool as read
+   data = ColumnAccumulator(['flavour'] + args.plan.mask_names() + args.discriminators, {'flavour' : np.uint8})
+   for chunk in timer.iterate('read', read_chunks(args, args.infiles[0])):
+      with timer.stage('select'):
+         timer.count('jets', chunk['flavour'].shape[0])
+         data.fill(chunk, args.plan.select(chunk))
+   with timer.stage('select'):
+      data = data.columns()
+      timer.count('selected_jets', data['flavour'].shape[0])
+   return data
+
+def roc_keys(args):
+   '(disc, region, signal, background) of every ROC'
+   return args.plan.roc_keys(args.discriminators)
+
+def roc_uncertainty(args, region, pair):
+   'uncertainty computed for the ROC of the (signal, background) pair in region'
+   if args.analytic:
+      return 'analytic'
+   if args.bootstrap and region in args.plan.bootstrap_regions and pair in args.plan.bootstrap_pairs:
+      return 'bootstrap'
+   return None
+
+def replica_batches(n_boots, nbatches):
+   'sizes of nbatches batches of replicas of about the same size, n_boots in total'
+   return [int(size) for size in np.diff(np.linspace(0, n_boots, nbatches + 1).astype(int)) if size]
+
+def compute_rocs(data, args, timer):
+   '''every ROC is independent, they are computed (in parallel if requested) by a
+   single pool before any plotting happens. The bootstrap replicas come first,
+   in batches per curve spread over all the jobs. Then each task sorts one
+   discriminator in one region and serves all the flavour pairs, the
+   per-flavour score shapes of the region come from the same counts'''
+   #jet indices of every region, shared by all discriminators and pairs
+   with timer.stage('index'):
+      masks = MaskIndex(data['flavour'], args.plan.region_masks(data), args.plan.flavours())
+
+   keys = [key for key in roc_keys(args) if roc_uncertainty(args, key[1], key[2:]) == 'bootstrap']
+   #enough batches of replicas for every job to have one
+   batches = replica_batches(BOOTSTRAP_REPLICAS, -(-args.jobs // max(len(keys), 1)))
+   bootstrap_tasks = [key + (size, args.bootstrap_weights, args.grid) for key in keys for size in batches]
+   tasks = [
+      (disc, region, args.plan.pairs, 'analytic' if args.analytic else None,
+       args.interval, args.mistags, args.grid)
+      for disc in args.discriminators
+      for region in args.plan.regions
+      ]
+
+   columns = dict((disc, data[disc]) for disc in args.discriminators)
+   columns['flavour'] = data['flavour']
+   columns.update(masks.arrays())
+   print 'computing %d ROCs in %d tasks with %d jobs' % (len(roc_keys(args)), len(bootstrap_tasks) + len(tasks), args.jobs)
+   replicas = {}
+   rocs = {}
+   shapes = {}
+   with TaskPool(columns, min(args.jobs, max(len(bootstrap_tasks), len(tasks)))) as pool:
+      timer.workers |= pool.workers
+      if bootstrap_tasks:
+         with timer.stage('bootstrap'):
+            parts = {}
+            for task, (newx, tprs) in zip(bootstrap_tasks, pool.map(pair_replicas, bootstrap_tasks)):
+               parts.setdefault(task[:4], (newx, []))[1].append(tprs)
+            for (disc, region, signal, background), (newx, tprs) in parts.items():
+               replicas.setdefault((disc, region), {})[signal, background] = (newx, np.vstack(tprs))
+      with timer.stage('analytic' if args.analytic else 'roc'):
+         tasks = [task + (replicas.get(task[:2]),) for task in tasks]
+         for task, (pair_rocs, region_shapes) in zip(tasks, pool.map(region_rocs, tasks)):
+            rocs.update(((task[0], task[1]) + pair, roc) for pair, roc in zip(args.plan.pairs, pair_rocs))
+            shapes.update(((task[0], task[1], flav), shape) for flav, shape in region_shapes.items())
+   return rocs, shapes
+
+def file_partial(infile, args):
+   '''mergeable partial result of one input file: per-flavour score histograms
+   with --approx, sorted score runs otherwise, together with its timing records'''
+   timer = StageTimer()
+   regions = list(args.plan.regions)
+   if args.approx:
+      partial = ScoreHistograms(args.discriminators, regions, args.plan.flavours(), nbins=args.bins)
    else:
-      fakes, eff, _ = roc_curve(truth, prediction)
-   plt.plot(eff, fakes, color, label='%s' % disc)   
-
-   flav_mask = (data.flavour == 5) | (data.flavour == 4)
-   truth = (data[flav_mask & disc_mask].flavour == 5).astype(float)
-   prediction = data[flav_mask & disc_mask][disc]
-   if args.bootstrap:
-      fakes, eff, unc = bootstrapped_roc(truth, prediction)
-      plt.fill_betweenx(fakes, eff-unc, eff+unc, color=color, alpha=0.3)
+      partial = ScoreRuns(args.discriminators, regions, args.plan.flavours())
+   for chunk in timer.iterate('read', read_chunks(args, infile)):
+      with timer.stage('select'):
+         timer.count('jets', chunk['flavour'].shape[0])
+         selected = args.plan.select(chunk)
+         timer.count('selected_jets', selected.sum())
+      with timer.stage('fill'):
+         partial.fill(chunk, selected, args.plan.region_masks(chunk))
+   if not args.approx:
+      with timer.stage('sort'):
+         partial.sort()
+   return partial, timer.stages, timer.counters
+
+def state_dir(args):
+   '''where --incremental keeps the partial results of the input files, one directory
+   per configuration the partials depend on'''
+   return os.path.join(args.outdir, 'state_%s' % provenance_key({
+      'tree' : TREE_NAME,
+      'selection' : args.plan.selection,
+      'regions' : args.plan.regions,
+      'flavours' : args.plan.flavours(),
+      'discriminators' : args.discriminators,
+      'approximate_bins' : args.bins if args.approx else None,
+      }))
+
+def merged_partial(args, timer):
+   '''partial result of all the input files, the partial of each file is merged
+   as soon as it is produced instead of holding all of them until the end.
+   With --incremental the merged partial is kept in a state, with the partial
+   of every file it contains: a rerun loads it, subtracts the partials of the
+   files changed or no longer given and only reads and adds the new or changed
+   files, its cost does not grow with the number of unchanged files'''
+   infiles = args.infiles
+   merged = None
+   if args.incremental:
+      directory = state_dir(args)
+      if not os.path.isdir(directory):
+         os.makedirs(directory)
+      partial_class = ScoreHistograms if args.approx else ScoreRuns
+      manifest = load_manifest(directory)
+      stored = manifest.get('files', {}) if manifest.get('merged') else {}
+      keys = dict((infile, cache_key(infile, TREE_NAME)) for infile in args.infiles)
+      files = dict((key['path'], key) for key in keys.values())
+      infiles = [infile for infile in args.infiles if keys[infile]['path'] not in stored or
+                 stored[keys[infile]['path']]['key'] != keys[infile]]
+      outdated = [path for path in stored if stored[path]['key'] != files.get(path)]
+      print '%d new or changed input files, %d unchanged, %d changed or removed partials to subtract' % (
+         len(infiles), len(args.infiles) - len(infiles), len(outdated))
+      if stored:
+         with timer.stage('load_state'):
+            merged = partial_class.load(os.path.join(directory, manifest['merged']))
+      entries = dict(stored)
+      for path in outdated:
+         with timer.stage('load_state'):
+            partial = partial_class.load(os.path.join(directory, entries.pop(path)['partial']))
+         with timer.stage('reduce'):
+            merged.subtract(partial)
+
+   with TaskPool(jobs=min(args.jobs, len(infiles))) as pool:
+      timer.workers |= pool.workers
+      results = pool.imap_unordered(file_partial, [(infile, args) for infile in infiles])
+      for (infile, _), (partial, stages, counters) in timer.iterate('map', results):
+         timer.merge(stages, counters)
+         if args.incremental:
+            with timer.stage('save_state'):
+               #named after the content, never overwriting the partial of a previous state
+               name = 'partial_%s.npz' % provenance_key(keys[infile])
+               partial.save(os.path.join(directory, name))
+               entries[keys[infile]['path']] = {'key' : keys[infile], 'partial' : name}
+         with timer.stage('reduce'):
+            merged = partial if merged is None else merged.merge(partial)
+
+   if args.incremental and (infiles or outdated):
+      with timer.stage('save_state'):
+         name = 'merged_%s.npz' % provenance_key(entries)
+         merged.save(os.path.join(directory, name))
+         save_manifest(directory, {'files' : entries, 'merged' : name})
+         #files of the previous state only removed once the new one is complete
+         kept = set([name] + [entry['partial'] for entry in entries.values()])
+         previous = [manifest['merged']] if manifest.get('merged') else []
+         for old in previous + [entry['partial'] for entry in stored.values()]:
+            if old not in kept and os.path.isfile(os.path.join(directory, old)):
+               os.remove(os.path.join(directory, old))
+   if not args.approx:
+      with timer.stage('sort'):
+         merged.sort()
+   return merged
+
+def partial_rocs(args, timer):
+   '''map-reduce over the input files: each file is reduced to a partial result
+   (in parallel with --jobs), the partials are merged and the ROCs derived from
+   the merged one, no merged tree is ever built. The --approx ROCs come from
+   histograms in O(bins) memory, exact up to the bin width. The per-flavour score
+   shapes come from the same merged counts'''
+   merged = merged_partial(args, timer)
+
+   rocs = {}
+   max_error = 0.
+   for key in roc_keys(args):
+      uncertainty = roc_uncertainty(args, key[1], key[2:])
+      with timer.stage(uncertainty or 'roc'):
+         replicas = None
+         if uncertainty == 'bootstrap':
+            y_true, _, thresholds = sort_scores(*merged.sample(*key))
+            replicas = bootstrap_replicas(y_true, thresholds, BOOTSTRAP_REPLICAS, args.bootstrap_weights, grid=args.grid)
+         rocs[key] = counted_roc(
+            merged.threshold_counts(*key), uncertainty,
+            args.interval, args.mistags, replicas, args.grid
+            )
+         if args.approx:
+            max_error = max(max_error, max(merged.max_error(*key)))
+   if args.approx:
+      print 'approximate ROCs, efficiency and mistag rate within %.2g of the exact ones' % max_error
+   shapes = {}
+   with timer.stage('shapes'):
+      for disc in args.discriminators:
+         for region in args.plan.regions:
+            region_shapes = flavour_shapes(*merged.region_counts(disc, region))
+            shapes.update(((disc, region, int(flav)), shape) for flav, shape in region_shapes.items())
+   return rocs, shapes
+
+def provenance(args):
+   '''everything the ROCs depend on, the stored ROCs are keyed on it so that
+   --replot can redraw them without recomputing'''
+   return {
+      'input' : [cache_key(infile, TREE_NAME) for infile in args.infiles],
+      'selection' : args.plan.description(),
+      'discriminators' : args.discriminators,
+      'bootstrap' : args.bootstrap,
+      'bootstrap_weights' : args.bootstrap_weights,
+      'analytic' : args.interval if args.analytic else None,
+      'mistags' : args.mistags,
+      'fpr_grid' : args.fpr_grid,
+      'approximate_bins' : args.bins if args.approx else None,
+      }
+
+def draw_roc(rocs, args, disc, region, signal, background, style='', label=None):
+   fakes, eff, unc, band, auc = rocs[disc, region, signal, background][:5]
+   if args.max_points:
+      #exact ROCs have one point per threshold, only keep those that matter for the drawing
+      keep = decimate_roc(fakes, eff, args.max_points, args.max_deviation)
+      fakes, eff = fakes[keep], eff[keep]
+      if unc is not None:
+         unc, band = unc[keep], band[:, keep]
+   color = args.plan.discriminators[disc]
+   if unc is not None:
+      #the analytic band also holds the mistag rate interval in its last rows
+      low, high = band[:2] if args.band == 'quantile' else (eff-unc, eff+unc)
+      plt.fill_betweenx(fakes, low, high, color=color, alpha=0.3)
+   if auc is not None and label is not None:
+      label = '%s (AUC %.4f $\\pm$ %.4f)' % ((label,) + tuple(auc))
+   plt.plot(eff, fakes, color+style, label=label)
+
+def save_figure(timer, name, figure=None):
+   'saves the current figure and clears it for the next plot, or saves and closes figure'
+   with timer.stage('savefig'):
+      (figure or plt).savefig('%s.png' % name)
+      (figure or plt).savefig('%s.pdf' % name)
+   if figure is None:
+      plt.clf()
+   else:
+      plt.close(figure)
+
+def plot_rocs(rocs, args, timer):
+   for plot in args.plan.plots:
+      print plot['name']
+      with timer.stage('plot'):
+         for disc in args.discriminators:
+            for curve in plot['curves']:
+               label = curve.get('label')
+               draw_roc(
+                  rocs, args, disc, curve['region'], curve['signal'], curve['background'],
+                  curve.get('style', ''), None if label is None else label.format(disc=disc)
+                  )
+         plt.ylabel('Mistag Rate')
+         plt.xlabel('Efficiency')
+         plt.legend(loc='best')
+         plt.ylim(5e-4, 1)
+         plt.gca().set_yscale('log')
+         plt.grid(which='both')
+         plt.xlim(0,1)
+      save_figure(timer, '%s/%s' % (args.outdir, plot['name']))
+
+def plot_shapes(shapes, args, timer):
+   '''normalized score distribution of each flavour, one plot per discriminator
+   with one panel per region'''
+   regions = list(args.plan.regions)
+   for disc in args.discriminators:
+      with timer.stage('plot'):
+         figure, axes = plt.subplots(1, len(regions), figsize=(5*len(regions), 4), sharey=True, squeeze=False)
+         for ax, region in zip(axes[0], regions):
+            for flav in args.plan.flavours():
+               values = shapes[disc, region, flav]
+               ax.step(SHAPE_EDGES, np.r_[values, values[-1:]], where='post', label=FLAVOUR_LABELS.get(flav, flav))
+            ax.set_title(region)
+            ax.set_xlabel('%s score' % disc)
+            ax.set_yscale('log')
+            ax.set_ylim(1e-5, 1)
+            ax.grid(which='both')
+            ax.legend(loc='best')
+         axes[0, 0].set_ylabel('Fraction of jets')
+         figure.tight_layout()
+      save_figure(timer, '%s/shapes_%s' % (args.outdir, disc), figure)
+
+def prepare_args(args):
+   '''expands the inputs and loads the plan, checking the discriminators against it,
+   and builds the fpr grid of the uncertainty bands'''
+   args.infiles = expand_inputs(args.infiles)
+   if not args.infiles:
+      parser.error('no input files found')
+   args.plan = Plan.load(args.plan)
+   if args.discriminators is None:
+      args.discriminators = list(args.plan.discriminators)
+   unknown = [disc for disc in args.discriminators if disc not in args.plan.discriminators]
+   if unknown:
+      parser.error('discriminators not in the plan: %s' % ' '.join(unknown))
+   args.grid = None
+   if args.fpr_grid:
+      low, high, points = args.fpr_grid
+      if not 0 < low < high or points < 2 or points != int(points):
+         parser.error('--fpr-grid needs 0 < MIN < MAX and at least 2 POINTS')
+      args.grid = np.logspace(np.log10(low), np.log10(high), int(points))
+   if args.approx and args.bootstrap:
+      parser.error('--bootstrap is not available for the approximate ROCs')
+   if args.analytic and args.bootstrap:
+      parser.error('--analytic and --bootstrap are alternatives')
+   return args
+
+def run_rocs(args, timer):
+   '''ROCs and shapes of the inputs, by map-reduce over the files with --approx,
+   --incremental or several inputs, from a single read of the input otherwise'''
+   if args.approx or args.incremental or len(args.infiles) > 1:
+      return partial_rocs(args, timer)
+   return compute_rocs(read_data(args, timer), args, timer)
+
+if __name__ == '__main__':
+   args = prepare_args(parser.parse_args())
+
+   if not os.path.isdir(args.outdir):
+      os.makedirs(args.outdir)
+
+   #wall time, CPU time and peak memory of every stage, reported at the end
+   timer = StageTimer()
+   artifact = artifact_path(args.outdir, provenance(args))
+   shapes_artifact = artifact_path(args.outdir, provenance(args), 'shapes')
+   if args.replot:
+      if not os.path.isfile(artifact) or not os.path.isfile(shapes_artifact):
+         parser.error('no ROCs computed for this input and options in %s, run without --replot first' % args.outdir)
+      with timer.stage('load'):
+         rocs, _ = load_rocs(artifact)
+         shapes, _ = load_shapes(shapes_artifact)
    else:
-      fakes, eff, _ = roc_curve(truth, prediction)
-   plt.plot(eff, fakes, color+'--')
-
-plt.ylabel('Mistag Rate')
-plt.xlabel('Efficiency')
-plt.legend(loc='best')
-plt.ylim(5e-4, 1)
-plt.gca().set_yscale('log')
-plt.grid(which='both')
-plt.xlim(0,1)
-plt.savefig('%s/FULL.png' % args.outdir)
-plt.savefig('%s/FULL.pdf' % args.outdir)
-plt.clf()
+      rocs, shapes = run_rocs(args, timer)
+      with timer.stage('save'):
+         save_rocs(artifact, rocs, provenance(args))
+         save_shapes(shapes_artifact, shapes, SHAPE_EDGES)
+
+   with timer.stage('save'):
+      save_working_points('%s/working_points' % args.outdir, rocs)
+   plot_rocs(rocs, args, timer)
+   plot_shapes(shapes, args, timer)
+   timer.write('%s/timing.json' % args.outdir, argv=sys.argv)
+   print timer.summary()
@@ -0,0 +1,78 @@
+#! /bin/env python
+'''writes a tree with the same layout as the FastBTV analyzer output, filled
+with synthetic jets, to test and benchmark make_rocs.py without a MiniAOD
+production'''
+import numpy as np
+from argparse import ArgumentParser
+import ROOT
+import root_numpy
+from tree_utils import TREE_NAME
+
+#same types as the branches booked in FastBTV.cc
+JET_DTYPE = [
+   ('run', 'u4'), ('lumi', 'u4'), ('evt', 'u4'), ('flavour', 'u4'),
+   ('jet_pt', 'f4'), ('jet_eta', 'f4'), ('jet_phi', 'f4'),
+   ('CSVv2', 'f4'), ('DeepCSV', 'f4'), ('DeepFlavour', 'f4'),
+]
+
+#hadron flavour fractions of ttbar jets
+FLAVOUR_FRACTIONS = [(0, 0.70), (4, 0.10), (5, 0.20)]
+
+#beta distribution parameters of the score of each flavour (udsg, c, b),
+#fraction of jets getting the tagger default value, and that value
+SCORE_SHAPES = {
+   'CSVv2' : ({0 : (0.7, 4.), 4 : (1.2, 2.), 5 : (3., 0.8)}, 0.03, -10.),
+   'DeepCSV' : ({0 : (0.5, 6.), 4 : (1.0, 3.), 5 : (3.5, 0.6)}, 0.02, -2.),
+   'DeepFlavour' : ({0 : (0.4, 8.), 4 : (0.9, 3.5), 5 : (4., 0.5)}, 0.02, -3.),
+}
+
+JETS_PER_EVENT = 6
+EVENTS_PER_LUMI = 1000
+
+def synthetic_jets(njets, rng, first_jet=0):
+   'one chunk of njets synthetic jets, first_jet sets the event numbering'
+   jets = np.zeros(njets, dtype=JET_DTYPE)
+   flavours, fractions = zip(*FLAVOUR_FRACTIONS)
+   jets['flavour'] = rng.choice(flavours, njets, p=fractions)
+   evt = (first_jet + np.arange(njets)) // JETS_PER_EVENT + 1
+   jets['evt'] = evt
+   jets['lumi'] = evt // EVENTS_PER_LUMI + 1
+   jets['run'] = 1
+   #falling spectrum above the 20 GeV threshold of slimmedJets
+   jets['jet_pt'] = 20. * (1. + rng.pareto(2.5, njets))
+   jets['jet_eta'] = np.clip(rng.normal(0., 1.8, njets), -4.7, 4.7)
+   jets['jet_phi'] = rng.uniform(-np.pi, np.pi, njets)
+   for disc, (shapes, default_fraction, default) in SCORE_SHAPES.items():
+      for flavour, (alpha, beta) in shapes.items():
+         is_flavour = (jets['flavour'] == flavour)
+         jets[disc][is_flavour] = rng.beta(alpha, beta, is_flavour.sum())
+      jets[disc][rng.uniform(size=njets) < default_fraction] = default
+   return jets
+
+def write_tree(outfile, chunks, treename=TREE_NAME):
+   'writes the chunks of jets in sequence into treename of outfile'
+   dirname, name = treename.rsplit('/', 1)
+   tfile = ROOT.TFile.Open(outfile, 'RECREATE')
+   tfile.mkdir(dirname).cd()
+   tree = None
+   for chunk in chunks:
+      tree = root_numpy.array2tree(chunk, name=name, tree=tree)
+   tfile.Write()
+   tfile.Close()
+
+def make_synthetic_tree(outfile, njets, seed=0, chunk_size=10**6):
+   rng = np.random.RandomState(seed)
+   write_tree(
+      outfile,
+      (synthetic_jets(min(chunk_size, njets - start), rng, start)
+       for start in range(0, njets, chunk_size))
+      )
+
+if __name__ == '__main__':
+   parser = ArgumentParser(description=__doc__)
+   parser.add_argument('outfile')
+   parser.add_argument('--jets', type=float, default=1e6, help='number of jets, e.g. 1e5 to 1e8')
+   parser.add_argument('--seed', type=int, default=0)
+   parser.add_argument('--chunk-size', type=float, default=1e6, help='jets generated and written at once')
+   args = parser.parse_args()
+   make_synthetic_tree(args.outfile, int(args.jets), args.seed, int(args.chunk_size))
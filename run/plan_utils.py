@@ -0,0 +1,100 @@
+import json
+import os
+from collections import OrderedDict
+from tree_utils import needed_branches
+from selection_utils import compile_expression, evaluate
+
+DEFAULT_PLAN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'default_plan.json')
+
+def read_plan(path):
+   '''the plan configuration of a JSON file, or YAML when PyYAML is installed'''
+   with open(path) as config:
+      if path.endswith(('.yaml', '.yml')):
+         import yaml
+         return yaml.safe_load(config)
+      return json.load(config, object_pairs_hook=OrderedDict)
+
+class Plan(object):
+   '''declarative description of the ROCs to produce: the jet selection, the regions
+   (selection expressions, null for all the selected jets), the signal and background
+   flavour pairs, the discriminators with their colour and the plots to draw.
+   It is compiled into the minimal work: the branches read, one mask per distinct
+   region expression and one sort per discriminator and region, shared by every pair'''
+   def __init__(self, config):
+      self.selection = config['selection']
+      self.regions = OrderedDict(config['regions'])
+      self.pairs = [tuple(pair) for pair in config['pairs']]
+      self.discriminators = OrderedDict(config['discriminators'])
+      self.plots = config.get('plots', [])
+      self.bootstrap_regions = config.get('bootstrap_regions', list(self.regions))
+      #by default only the pairs drawn are bootstrapped, all of them without plots
+      drawn = set((curve['signal'], curve['background']) for plot in self.plots for curve in plot['curves'])
+      self.bootstrap_pairs = [
+         tuple(pair) for pair in config.get('bootstrap_pairs', [pair for pair in self.pairs if pair in drawn or not drawn])
+         ]
+      #regions with the same expression share one mask, named after the first of them
+      #and prefixed so that it never replaces a branch of the same name
+      self.masks = OrderedDict()
+      for region, expression in self.regions.items():
+         if expression is not None:
+            self.masks.setdefault(expression, 'mask:%s' % region)
+      for plot in self.plots:
+         for curve in plot['curves']:
+            if curve['region'] not in self.regions or \
+                  (curve['signal'], curve['background']) not in self.pairs:
+               raise ValueError('plot %s draws a ROC not in the plan: %s' % (plot['name'], curve))
+
+   @classmethod
+   def load(cls, path=DEFAULT_PLAN):
+      return cls(read_plan(path))
+
+   def mask_name(self, region):
+      'column holding the mask of region, None for all the selected jets'
+      expression = self.regions[region]
+      return None if expression is None else self.masks[expression]
+
+   def mask_names(self):
+      return list(self.masks.values())
+
+   def flavours(self):
+      return sorted(set(flavour for pair in self.pairs for flavour in pair))
+
+   def branches(self, discriminators):
+      'branches needed by the selection, the regions and the discriminators'
+      return needed_branches(
+         ['flavour'], compile_expression(self.selection).branches,
+         *([compile_expression(expression).branches for expression in self.masks] + [discriminators])
+         )
+
+   def select(self, chunk):
+      '''adds the mask of every distinct region expression to the chunk, under
+      its mask_name, and returns the mask of the selected jets'''
+      for expression, name in self.masks.items():
+         chunk[name] = evaluate(expression, chunk)
+      return evaluate(self.selection, chunk)
+
+   def region_masks(self, columns):
+      'mask of each region over columns filled by select, None for all of them'
+      return OrderedDict(
+         (region, None if self.mask_name(region) is None else columns[self.mask_name(region)])
+         for region in self.regions
+         )
+
+   def roc_keys(self, discriminators):
+      '(disc, region, signal, background) of every ROC'
+      return [
+         (disc, region, signal, background)
+         for signal, background in self.pairs
+         for disc in discriminators
+         for region in self.regions
+         ]
+
+   def description(self):
+      'what the ROCs depend on, recorded in their provenance'
+      return OrderedDict([
+         ('selection', self.selection),
+         ('regions', self.regions),
+         ('pairs', self.pairs),
+         ('bootstrap_regions', self.bootstrap_regions),
+         ('bootstrap_pairs', self.bootstrap_pairs),
+         ])
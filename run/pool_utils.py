@@ -0,0 +1,78 @@
+import multiprocessing
+import numpy as np
+
+#columns seen by the worker processes, attached once per worker, None for tasks without columns
+_columns = None
+
+def share_columns(columns):
+   '''copies each column to an anonymous shared memory block, the blocks are
+   handed to the workers at start-up instead of pickling the data per task'''
+   shared = []
+   for name, column in columns.items():
+      column = np.ascontiguousarray(column)
+      block = multiprocessing.RawArray('b', column.nbytes)
+      np.frombuffer(block, dtype=column.dtype)[:] = column
+      shared.append((name, column.dtype.str, block))
+   return shared
+
+def attach_columns(shared):
+   global _columns
+   _columns = dict(
+      (name, np.frombuffer(block, dtype=np.dtype(dtype)))
+      for name, dtype, block in shared
+      )
+
+def call_task(columns, function, args):
+   return function(*args) if columns is None else function(columns, *args)
+
+def run_task(task):
+   number, function, args = task
+   return number, call_task(_columns, function, args)
+
+class TaskPool(object):
+   '''pool of jobs worker processes sharing the columns, started once and used by
+   every map of a run, so that the columns are copied to shared memory only once.
+   Tasks are evaluated as function(columns, *task), or function(*task) without
+   columns, in this process when jobs <= 1, workers tells which. Only the task
+   arguments and the results travel through pickling'''
+   def __init__(self, columns=None, jobs=1):
+      self.columns = columns
+      self.pool = None
+      self.workers = jobs > 1
+      if jobs > 1:
+         if columns is None:
+            self.pool = multiprocessing.Pool(jobs)
+         else:
+            self.pool = multiprocessing.Pool(jobs, initializer=attach_columns, initargs=(share_columns(columns),))
+
+   def __enter__(self):
+      return self
+
+   def __exit__(self, *error):
+      self.close()
+
+   def close(self):
+      if self.pool is not None:
+         self.pool.close()
+         self.pool.join()
+         self.pool = None
+
+   def map(self, function, tasks):
+      'returns [function(columns, *task) for task in tasks]'
+      tasks = list(tasks)
+      if self.pool is None:
+         return [call_task(self.columns, function, task) for task in tasks]
+      numbered = [(number, function, task) for number, task in enumerate(tasks)]
+      return [result for _, result in self.pool.map(run_task, numbered, chunksize=1)]
+
+   def imap_unordered(self, function, tasks):
+      '''yields (task, result) as soon as each task is done, so that the results
+      can be consumed without holding all of them'''
+      tasks = list(tasks)
+      if self.pool is None:
+         for task in tasks:
+            yield task, call_task(self.columns, function, task)
+         return
+      numbered = [(number, function, task) for number, task in enumerate(tasks)]
+      for number, result in self.pool.imap_unordered(run_task, numbered):
+         yield tasks[number], result
@@ -0,0 +1,468 @@
+import heapq
+import json
+import numpy as np
+from scipy.special import erfinv
+from scipy.stats import beta
+from kernel_utils import run_ends, weighted_counts, grid_segments
+
+def sort_scores(true, pred):
+   '''sorts the sample once by decreasing score, returns the labels in that order
+   and the position of the last jet of each distinct threshold'''
+   y_true = np.asarray(true, dtype=bool)
+   y_pred = np.asarray(pred)
+   order = np.argsort(y_pred, kind='mergesort')[::-1]
+   y_true = y_true[order]
+   y_pred = y_pred[order]
+   thresholds = run_ends(y_pred)
+   return y_true, y_pred[thresholds], thresholds
+
+#mistag rates of the working points
+WORKING_POINTS = (0.1, 0.01, 0.001)
+#score bins of the per-flavour shape histograms
+SHAPE_EDGES = np.linspace(0, 1, 51)
+
+def roc_counts(true, pred):
+   '''distinct thresholds, by decreasing value, and the cumulative signal (tps) and
+   background (fps) counts above each of them, from a single sort of the sample'''
+   y_true, y_pred, thresholds = sort_scores(true, pred)
+   tps = np.cumsum(y_true)[thresholds]
+   return y_pred, tps, thresholds + 1 - tps
+
+def counts_roc(thresholds, tps, fps, drop_intermediate=False):
+   '''ROC (fpr, tpr, thresholds) from cumulative counts, the same as roc_curve
+   returns, including the removal of collinear points with drop_intermediate'''
+   if drop_intermediate and len(fps) > 2:
+      optimal = np.r_[True, np.logical_or(np.diff(fps, 2), np.diff(tps, 2)), True]
+      thresholds, tps, fps = thresholds[optimal], tps[optimal], fps[optimal]
+   tps = np.r_[0, tps]
+   fps = np.r_[0, fps]
+   thresholds = np.r_[thresholds[:1] + 1, thresholds]
+   return fps / float(max(fps[-1], 1)), tps / float(max(tps[-1], 1)), thresholds
+
+def working_points(thresholds, tps, fps, mistags=WORKING_POINTS, fpr=None, unc=None):
+   '''loosest threshold keeping the mistag rate within each of mistags, from the
+   cumulative counts. Returns one row per working point: the target mistag rate,
+   the threshold, the efficiency, the actual mistag rate and the efficiency
+   uncertainty, interpolated from unc given on fpr (nan without it, and for all
+   the columns of the working points tighter than the tightest threshold, or
+   for all the working points when no jet of the pair is left)'''
+   mistags = np.asarray(mistags, dtype=float)
+   if not len(fps):
+      return np.vstack([mistags] + [np.full(mistags.size, np.nan)]*4).T
+   fakes = fps / float(max(fps[-1], 1))
+   index = np.searchsorted(fakes, mistags, side='right') - 1
+   found = (index >= 0)
+   index = np.maximum(index, 0)
+   table = np.vstack([
+      mistags,
+      np.asarray(thresholds, dtype=float)[index],
+      tps[index] / float(max(tps[-1], 1)),
+      fakes[index],
+      np.interp(mistags, fpr, unc) if unc is not None else np.full(mistags.size, np.nan),
+      ]).T
+   table[~found, 1:] = np.nan
+   return table
+
+def weighted_roc(y_true, thresholds, weights):
+   '''ROC (fpr, tpr) of a weighted replica of a sample already sorted by sort_scores,
+   the (0, 0) point is prepended as sklearn does'''
+   tps, fps = weighted_counts(y_true, thresholds, weights)
+   tps = np.r_[0, tps]
+   fps = np.r_[0, fps]
+   return fps / float(fps[-1]), tps / float(tps[-1])
+
+def bootstrap_weights(size, mode, rng):
+   '''per-jet weights of a bootstrap replica: multinomial reproduces resampling
+   with replacement, poisson is its large-sample approximation'''
+   if mode == 'multinomial':
+      return np.bincount(rng.randint(0, size, size), minlength=size)
+   elif mode == 'poisson':
+      return rng.poisson(1., size)
+   raise ValueError('unknown bootstrap weights mode %s' % mode)
+
+def bootstrap_replicas(y_true, thresholds, n_boots=200, weights='multinomial', rng=None, grid=None):
+   '''efficiency of n_boots replicas of a sample already sorted by sort_scores on
+   the fpr grid, by default np.logspace(-4, 0, 80), one row per replica. Each
+   replica reweights the sorted sample, which makes it linear in the sample size.
+   Only the ends of the segments around the fpr grid points are kept from each
+   replica, all the replicas are then interpolated linearly onto the grid at once.
+   Returns the grid and the efficiencies, nan without jets of either class'''
+   rng = rng or np.random.RandomState()
+   newx = np.logspace(-4, 0, 80) if grid is None else np.asarray(grid, dtype=float)
+   if y_true.all() or not y_true.any():
+      return newx, np.full((n_boots, newx.size), np.nan)
+   #fpr and efficiency at both ends of the segment around each grid point, per replica
+   segments = np.empty((4, n_boots, newx.size))
+   for iboot in range(n_boots):
+      fakes, effs = weighted_roc(
+         y_true, thresholds,
+         bootstrap_weights(y_true.size, weights, rng)
+         )
+      first, second = grid_segments(fakes, newx)
+      segments[:, iboot] = fakes[first], fakes[second], effs[first], effs[second]
+   #linear interpolation to a uniform spacing, allowing averaging
+   x0, x1, y0, y1 = segments
+   return newx, y0 + (newx - x0) * (y1 - y0) / (x1 - x0)
+
+def bootstrap_bands(newx, tprs, quantiles=(0.16, 0.84)):
+   '''the fpr grid, the mean and standard deviation of the efficiency of the
+   bootstrap_replicas and its requested quantiles, one row per quantile, all nan
+   for the nan replicas of a pair without jets of either class'''
+   if np.isnan(tprs).all():
+      nan = np.full(newx.size, np.nan)
+      return newx, nan, nan, np.full((len(quantiles), newx.size), np.nan)
+   bands = np.percentile(tprs, 100*np.asarray(quantiles), axis=0)
+   return newx, tprs.mean(axis=0), tprs.std(axis=0, ddof=1), bands
+
+def bootstrapped_roc(true, pred, n_boots=200, weights='multinomial', seed=None, quantiles=(0.16, 0.84), grid=None):
+   '''from https://stackoverflow.com/questions/19124239/scikit-learn-roc-curve-with-confidence-intervals
+   the scores are sorted only once and reweighted by bootstrap_replicas.
+   Returns the bootstrap_bands'''
+   y_true, _, thresholds = sort_scores(true, pred)
+   return bootstrap_bands(*bootstrap_replicas(
+      y_true, thresholds, n_boots, weights, np.random.RandomState(seed), grid
+      ), quantiles=quantiles)
+
+def binomial_interval(successes, trials, method='wilson', level=0.6827):
+   '''central interval of a binomial fraction at the given confidence level,
+   Wilson score or Clopper-Pearson (exact, conservative)'''
+   successes = np.asarray(successes, dtype=float)
+   trials = float(max(trials, 1))
+   if method == 'wilson':
+      z = np.sqrt(2.) * erfinv(level)
+      fraction = successes / trials
+      denominator = 1. + z**2 / trials
+      center = (fraction + z**2 / (2*trials)) / denominator
+      half = z * np.sqrt(fraction*(1 - fraction) / trials + z**2 / (4*trials**2)) / denominator
+      return center - half, center + half
+   elif method == 'clopper-pearson':
+      alpha = 1. - level
+      with np.errstate(invalid='ignore'):
+         low = np.where(successes > 0, beta.ppf(alpha/2, successes, trials - successes + 1), 0.)
+         high = np.where(successes < trials, beta.ppf(1 - alpha/2, successes + 1, trials - successes), 1.)
+      return low, high
+   raise ValueError('unknown binomial interval %s' % method)
+
+def delong_auc(tps, fps):
+   '''AUC and its DeLong standard deviation from the cumulative counts above each
+   distinct threshold, ties count one half. The structural components of DeLong
+   are constant within a threshold, so this is linear in the number of thresholds.
+   Both are nan without jets of either class'''
+   tps = np.asarray(tps, dtype=float)
+   fps = np.asarray(fps, dtype=float)
+   if not len(tps) or not tps[-1] or not fps[-1]:
+      return np.nan, np.nan
+   npos, nneg = tps[-1], fps[-1]
+   pos = np.diff(np.r_[0., tps])
+   neg = np.diff(np.r_[0., fps])
+   #fraction of background jets below each signal jet, of signal jets above each background jet
+   v10 = (nneg - fps + 0.5*neg) / nneg
+   v01 = (tps - 0.5*pos) / npos
+   auc = np.dot(pos, v10) / npos
+   var10 = np.dot(pos, (v10 - auc)**2) / max(npos - 1, 1)
+   var01 = np.dot(neg, (v01 - auc)**2) / max(nneg - 1, 1)
+   return auc, np.sqrt(var10 / npos + var01 / nneg)
+
+def analytic_roc(tps, fps, grid=None, interval='wilson', level=0.6827):
+   '''analytic alternative to bootstrapped_roc, from the cumulative counts of
+   roc_counts, in one pass. Returns the fpr grid, the efficiency on it, its
+   binomial standard deviation, the binomial intervals of the efficiency and
+   of the mistag rate (one row per bound) and the AUC with its DeLong uncertainty.
+   Without jets in the pair the efficiency is zero, as in counts_roc'''
+   newx = np.logspace(-4, 0, 80) if grid is None else np.asarray(grid)
+   npos, nneg = (float(tps[-1]), float(fps[-1])) if len(tps) else (0., 0.)
+   fakes = np.r_[0, fps] / max(nneg, 1)
+   effs = np.r_[0, tps] / max(npos, 1)
+   #remove duplicates in the ROC, as the bootstrap does
+   unique = np.r_[True, np.diff(fakes) > 0]
+   eff = np.interp(newx, fakes[unique], effs[unique])
+   unc = np.sqrt(eff*(1 - eff) / max(npos, 1))
+   band = np.vstack(
+      binomial_interval(eff*npos, npos, interval, level) +
+      binomial_interval(newx*nneg, nneg, interval, level)
+      )
+   return newx, eff, unc, band, np.array(delong_auc(tps, fps))
+
+def counted_roc(counts, uncertainty=None, interval='wilson', mistags=WORKING_POINTS,
+                replicas=None, grid=None):
+   '''ROC fpr, tpr, efficiency uncertainty, bands and AUC, the three latter only
+   with a bootstrap or analytic uncertainty (no AUC for the bootstrap), followed
+   by the working points, from the (thresholds, tps, fps) counts of roc_counts.
+   The bootstrap takes the (grid, efficiencies) of its bootstrap_replicas. The
+   analytic uncertainty is given on the fpr grid, by default np.logspace(-4, 0, 80)'''
+   thresholds, tps, fps = counts
+   if uncertainty == 'bootstrap':
+      curve = bootstrap_bands(*replicas) + (None,)
+   elif uncertainty == 'analytic':
+      curve = analytic_roc(tps, fps, grid, interval=interval)
+   else:
+      fakes, eff, _ = counts_roc(thresholds, tps, fps, drop_intermediate=True)
+      curve = (fakes, eff, None, None, None)
+   return curve + (working_points(thresholds, tps, fps, mistags, curve[0], curve[2]),)
+
+def flavour_counts(scores, flavour, flavours):
+   '''distinct thresholds of scores sorted by decreasing value and, for each of the
+   flavours, the cumulative number of its jets above each threshold'''
+   thresholds = run_ends(scores)
+   return scores[thresholds], dict((flav, np.cumsum(flavour == flav)[thresholds]) for flav in flavours)
+
+def flavour_shapes(thresholds, counts, edges=SHAPE_EDGES):
+   '''normalized score histogram of each flavour over edges, from the distinct
+   thresholds by decreasing value and the cumulative counts of flavour_counts,
+   by difference of the counts above consecutive edges. As with np.histogram the
+   last bin includes its upper edge, the scores outside the edges (tagger default
+   values) are in no bin but count in the normalization'''
+   above = np.searchsorted(-thresholds, -edges, side='right')
+   above[-1] = np.searchsorted(-thresholds, -edges[-1], side='left')
+   shapes = {}
+   for flav, cumulative in counts.items():
+      cumulative = np.r_[0, cumulative]
+      shapes[flav] = -np.diff(cumulative[above]) / float(max(cumulative[-1], 1))
+   return shapes
+
+def pair_counts(thresholds, counts, signal, background):
+   '''roc_counts of the signal vs background jets from the cumulative counts of each
+   flavour over thresholds shared by more flavours: the thresholds where neither
+   count changes only belong to other flavours and are dropped'''
+   tps, fps = counts[signal], counts[background]
+   changed = np.diff(np.r_[0, tps + fps]) > 0
+   return thresholds[changed], tps[changed], fps[changed]
+
+def pair_replicas(columns, disc, region, signal, background, n_boots=200, weights='multinomial', grid=None):
+   '''bootstrap_replicas of the ROC of disc for signal vs background jets in region,
+   columns as for region_rocs. Only the jets of the pair are sorted, so that the
+   replicas of a curve can be split in batches evaluated separately'''
+   index = columns['index', region]
+   flavour = columns['flavour'][index]
+   index = index[(flavour == signal) | (flavour == background)]
+   y_true, _, thresholds = sort_scores(columns['flavour'][index] == signal, columns[disc][index])
+   return bootstrap_replicas(y_true, thresholds, n_boots, weights, grid=grid)
+
+def region_rocs(columns, disc, region, pairs, uncertainty=None, interval='wilson',
+                mistags=WORKING_POINTS, grid=None, replicas=None):
+   '''ROCs of disc for every (signal, background) pair in region, columns holds the
+   discriminators, the flavour and the MaskIndex arrays. The jets of all the flavours
+   in the region are sorted once, every pair follows in O(n) from the cumulative
+   counts of each flavour, which also give the flavour_shapes of the region.
+   The pairs in replicas, a dict of their pair_replicas, get the bootstrap
+   uncertainty, the others the uncertainty given.
+   Returns one counted_roc result per pair and the shapes'''
+   replicas = replicas or {}
+   index = columns['index', region]
+   index = index[np.argsort(columns[disc][index], kind='mergesort')[::-1]]
+   scores = columns[disc][index]
+   flavour = columns['flavour'][index]
+   thresholds, counts = flavour_counts(scores, flavour, set(flav for pair in pairs for flav in pair))
+   rocs = []
+   for pair in pairs:
+      rocs.append(counted_roc(
+         pair_counts(thresholds, counts, *pair),
+         'bootstrap' if pair in replicas else uncertainty,
+         interval, mistags, replicas.get(pair), grid
+         ))
+   return rocs, flavour_shapes(thresholds, counts)
+
+def group_counts(groups, scores, true):
+   '''roc_counts of every group at once, the jets being sorted by group and then by
+   decreasing score: one cumulative sum over all the jets, the counts before the
+   first jet of each group subtracted. Returns the group of each segment, the
+   start of each segment and the thresholds, tps and fps of all of them'''
+   size = scores.size
+   if not size:
+      empty = np.array([], dtype=int)
+      return groups[:0], empty, scores[:0], empty, empty
+   new_group = np.diff(groups) != 0
+   last = np.r_[np.where(new_group | (np.diff(scores) != 0))[0], size - 1]
+   firsts = np.r_[0, np.where(new_group)[0] + 1]
+   starts = np.r_[0, np.where(np.diff(groups[last]) != 0)[0] + 1]
+   lengths = np.diff(np.r_[starts, last.size])
+   cumulative = np.r_[0, np.cumsum(true)]
+   before = np.repeat(cumulative[firsts], lengths)
+   tps = cumulative[last + 1] - before
+   fps = (last + 1 - np.repeat(firsts, lengths)) - tps
+   return groups[firsts], starts, scores[last], tps, fps
+
+def grouped_auc(starts, tps, fps):
+   '''delong_auc of every segment of the group_counts, with segment-wise sums:
+   the AUCs and their standard deviations, nan for the groups without signal
+   or background'''
+   tps = np.asarray(tps, dtype=float)
+   fps = np.asarray(fps, dtype=float)
+   ends = np.r_[starts[1:], tps.size] - 1
+   lengths = ends + 1 - starts
+   npos, nneg = tps[ends], fps[ends]
+   pos = np.diff(np.r_[0., tps])
+   neg = np.diff(np.r_[0., fps])
+   pos[starts] = tps[starts]
+   neg[starts] = fps[starts]
+   with np.errstate(divide='ignore', invalid='ignore'):
+      v10 = (np.repeat(nneg, lengths) - fps + 0.5*neg) / np.repeat(nneg, lengths)
+      v01 = (tps - 0.5*pos) / np.repeat(npos, lengths)
+      auc = np.add.reduceat(pos * v10, starts) / npos
+      var10 = np.add.reduceat(pos * (v10 - np.repeat(auc, lengths))**2, starts) / np.maximum(npos - 1, 1)
+      var01 = np.add.reduceat(neg * (v01 - np.repeat(auc, lengths))**2, starts) / np.maximum(nneg - 1, 1)
+      return auc, np.sqrt(var10 / npos + var01 / nneg)
+
+def grouped_rocs(groups, scores, flavour, pairs):
+   '''exact ROC counts and AUCs of every (signal, background) pair in every group
+   of jets, e.g. pt bins, from a single lexsort of all the jets by group and score
+   instead of one selection and sort per group. Returns, per pair, the group_counts
+   followed by the AUCs and their uncertainties of grouped_auc'''
+   order = np.lexsort((-scores, groups))
+   groups, scores, flavour = groups[order], scores[order], flavour[order]
+   rocs = {}
+   for signal, background in pairs:
+      in_pair = (flavour == signal) | (flavour == background)
+      counts = group_counts(groups[in_pair], scores[in_pair], flavour[in_pair] == signal)
+      rocs[signal, background] = counts + grouped_auc(*counts[1:2] + counts[3:])
+   return rocs
+
+def decimate_roc(fpr, tpr, max_points=2000, tolerance=1e-3, fpr_floor=1e-5):
+   '''indices of at most max_points points of a ROC curve, chosen by Ramer-Douglas-Peucker
+   refinement in (tpr, log10 fpr) space: the chord deviating the most from the curve
+   is split first, until every dropped point lies within tolerance of the drawn
+   polyline or max_points are used. Distances are in units of the axis ranges,
+   tpr in [0, 1] and log10 fpr in [log10 fpr_floor, 0]'''
+   npoints = len(fpr)
+   if npoints <= max(max_points, 2):
+      return np.arange(npoints)
+   x = np.asarray(tpr, dtype=float)
+   y = np.log10(np.maximum(fpr, fpr_floor)) / -np.log10(fpr_floor)
+
+   def farthest(first, last):
+      'largest distance from the first-last chord of the points in between, and its index'
+      dx = x[last] - x[first]
+      dy = y[last] - y[first]
+      xs = x[first+1:last] - x[first]
+      ys = y[first+1:last] - y[first]
+      norm = np.hypot(dx, dy)
+      dist = np.abs(xs*dy - ys*dx) / norm if norm else np.hypot(xs, ys)
+      ipoint = np.argmax(dist)
+      return dist[ipoint], first + 1 + ipoint
+
+   keep = [0, npoints - 1]
+   dist, split = farthest(0, npoints - 1)
+   heap = [(-dist, 0, npoints - 1, split)]
+   while heap and len(keep) < max_points:
+      dist, first, last, split = heapq.heappop(heap)
+      if -dist <= tolerance:
+         break
+      keep.append(split)
+      for start, stop in [(first, split), (split, last)]:
+         if stop - start > 1:
+            dist, point = farthest(start, stop)
+            heapq.heappush(heap, (-dist, start, stop, point))
+   return np.sort(keep)
+
+class ScoreRuns(object):
+   '''scores of each discriminator per region and jet flavour, kept as sorted runs.
+   The exact counterpart of ScoreHistograms: filled chunk by chunk, sorted once
+   per file and merged across files without building a merged tree'''
+   def __init__(self, discriminators, regions, flavours=(0, 4, 5)):
+      self.discriminators = list(discriminators)
+      self.regions = list(regions)
+      self.flavours = list(flavours)
+      self.runs = dict(
+         ((disc, region, flavour), [])
+         for disc in self.discriminators for region in self.regions for flavour in self.flavours
+         )
+      #flavour counts of each (disc, region), computed once the runs are final
+      self._counts = {}
+      #whether every key holds a single sorted run
+      self.is_sorted = True
+
+   def fill(self, chunk, selected, regions):
+      '''adds the selected jets of the chunk, regions maps each region name to
+      a mask over the chunk or to None for all the selected jets'''
+      self._counts = {}
+      self.is_sorted = False
+      flavour = chunk['flavour'][selected]
+      scores = dict((disc, chunk[disc][selected]) for disc in self.discriminators)
+      for region in self.regions:
+         in_region = None if regions[region] is None else regions[region][selected]
+         for flav in self.flavours:
+            mask = (flavour == flav) if in_region is None else in_region & (flavour == flav)
+            for disc in self.discriminators:
+               self.runs[disc, region, flav].append(scores[disc][mask])
+
+   def sort(self):
+      'concatenates and sorts the scores of each key into a single run'
+      if not self.is_sorted:
+         for key, runs in self.runs.items():
+            self.runs[key] = [np.sort(np.concatenate(runs) if runs else np.array([]), kind='mergesort')]
+         self.is_sorted = True
+      return self
+
+   def merge(self, other):
+      '''adds the runs of other to these, all the runs of a key are only sorted
+      together once, by sort, when the scores are needed'''
+      self._counts = {}
+      self.is_sorted = False
+      for key, runs in other.runs.items():
+         self.runs.setdefault(key, []).extend(runs)
+      return self
+
+   def subtract(self, other):
+      '''removes the scores of other, previously merged into these: each of them
+      is found by binary search in the sorted run, among the equal scores'''
+      self._counts = {}
+      self.sort()
+      other.sort()
+      for key, runs in other.runs.items():
+         scores, removed = self.runs[key][0], runs[0]
+         #the k-th of equal removed scores is the k-th of the equal stored ones
+         positions = np.searchsorted(scores, removed, side='left') + \
+            np.arange(removed.size) - np.searchsorted(removed, removed, side='left')
+         #nan, sorted last, is the only score unequal to itself
+         if removed.size and (positions[-1] >= scores.size or
+                              not np.all((scores[positions] == removed) | (removed != removed))):
+            raise ValueError('cannot subtract scores that were not merged, for %s/%s/%d' % key)
+         self.runs[key] = [np.delete(scores, positions)]
+      return self
+
+   def save(self, path):
+      'stores the sorted runs and the configuration in the compressed npz file path'
+      self.sort()
+      arrays = dict(('%s/%s/%d' % key, runs[0]) for key, runs in self.runs.items())
+      arrays['config'] = np.array(json.dumps({
+         'discriminators' : self.discriminators, 'regions' : self.regions, 'flavours' : self.flavours,
+         }))
+      np.savez_compressed(path, **arrays)
+
+   @classmethod
+   def load(cls, path):
+      'inverse of save'
+      with np.load(path) as stored:
+         runs = cls(**json.loads(str(stored['config'])))
+         for key in runs.runs:
+            runs.runs[key] = [stored['%s/%s/%d' % key]]
+      return runs
+
+   def scores(self, disc, region, flavour):
+      self.sort()
+      return self.runs[disc, region, flavour][0]
+
+   def region_counts(self, disc, region):
+      '''distinct thresholds of all the flavours in region, by decreasing value, and the
+      cumulative count of each flavour above them, shared by every flavour pair'''
+      if (disc, region) not in self._counts:
+         scores = dict((flav, self.scores(disc, region, flav)) for flav in self.flavours)
+         thresholds = np.unique(np.concatenate(list(scores.values())))[::-1]
+         self._counts[disc, region] = thresholds, dict(
+            (flav, values.size - np.searchsorted(values, thresholds, side='left'))
+            for flav, values in scores.items()
+            )
+      return self._counts[disc, region]
+
+   def threshold_counts(self, disc, region, signal, background):
+      'distinct thresholds and the cumulative signal and background counts above each of them'
+      return pair_counts(*self.region_counts(disc, region), signal=signal, background=background)
+
+   def roc(self, disc, region, signal, background):
+      return counts_roc(*self.threshold_counts(disc, region, signal, background))
+
+   def sample(self, disc, region, signal, background):
+      'boolean truth labels and scores of the signal and background jets, as roc_curve takes them'
+      sig = self.scores(disc, region, signal)
+      bkg = self.scores(disc, region, background)
+      return np.r_[np.ones(sig.size, dtype=bool), np.zeros(bkg.size, dtype=bool)], np.r_[sig, bkg]
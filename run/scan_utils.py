@@ -0,0 +1,139 @@
+import numpy as np
+
+def window_sums(cells, weta, wphi):
+   '''sums of the (eta, phi) cells over every window of weta x wphi cells, phi wrapping
+   around, from the summed-area table of the cells in O(1) per window. Element [i, j]
+   is the window starting at eta cell i and phi cell j'''
+   cells = np.concatenate([cells, cells[:, :wphi - 1]], axis=1)
+   table = np.zeros((cells.shape[0] + 1, cells.shape[1] + 1), dtype=cells.dtype)
+   table[1:, 1:] = cells.cumsum(axis=0).cumsum(axis=1)
+   return table[weta:, wphi:] - table[:-weta, wphi:] - table[weta:, :-wphi] + table[:-weta, :-wphi]
+
+class EtaPhiHistograms(object):
+   '''jet counts per flavour, fine (eta, phi) cell and discriminator score bin, filled
+   in one pass over a stream of chunks and mergeable across files. The working point
+   efficiency and mistag rate of every rectangular eta-phi window follow from them.
+   Scores use nbins uniform bins over [low, high) plus underflow and overflow bins,
+   as in ScoreHistograms, so working point thresholds are bin edges'''
+   def __init__(self, discriminators, flavours=(0, 4, 5), cell=0.1, eta_range=(-2.5, 2.5),
+                nbins=200, low=0., high=1.):
+      self.discriminators = list(discriminators)
+      self.flavours = np.array(sorted(flavours))
+      self.eta_low = eta_range[0]
+      self.neta = int(round((eta_range[1] - eta_range[0]) / cell))
+      self.eta_cell = (eta_range[1] - eta_range[0]) / float(self.neta)
+      self.nphi = int(round(2 * np.pi / cell))
+      self.phi_cell = 2 * np.pi / self.nphi
+      self.nbins = nbins
+      self.low = low
+      self.high = high
+      self.shape = (self.flavours.size, self.neta, self.nphi, nbins + 2)
+      self.counts = dict((disc, np.zeros(self.shape, dtype=np.int64)) for disc in self.discriminators)
+
+   def bin_index(self, scores):
+      'score bin of each score, 0 is the underflow and nbins+1 the overflow'
+      #in float64 as bin_edges, float32 scores would be rounded to the wrong side of some edges
+      scores = np.asarray(scores, dtype=np.float64)
+      index = np.floor((scores - self.low) * (self.nbins / float(self.high - self.low)))
+      return np.clip(index, -1, self.nbins).astype(np.int64) + 1
+
+   def bin_edges(self):
+      'lower edge of each score bin, -inf for the underflow'
+      edges = self.low + (np.arange(self.nbins + 2) - 1) * (self.high - self.low) / float(self.nbins)
+      edges[0] = -np.inf
+      return edges
+
+   def fill(self, chunk, selected):
+      'adds the selected jets of the chunk, those outside the eta range are skipped'
+      flavour = chunk['flavour'][selected]
+      iflavour = np.minimum(np.searchsorted(self.flavours, flavour), self.flavours.size - 1)
+      ieta = np.floor((chunk['jet_eta'][selected] - self.eta_low) / self.eta_cell).astype(np.int64)
+      iphi = np.floor((chunk['jet_phi'][selected] + np.pi) / self.phi_cell).astype(np.int64) % self.nphi
+      inside = (self.flavours[iflavour] == flavour) & (ieta >= 0) & (ieta < self.neta)
+      cell = ((iflavour * self.neta + ieta) * self.nphi + iphi) * (self.nbins + 2)
+      size = int(np.prod(self.shape))
+      for disc in self.discriminators:
+         flat = cell + self.bin_index(chunk[disc][selected])
+         self.counts[disc] += np.bincount(flat[inside], minlength=size).reshape(self.shape)
+
+   def merge(self, other):
+      'adds the counts of other, which must have the same binning'
+      if other.shape != self.shape or (other.eta_low, other.low, other.high) != (self.eta_low, self.low, self.high) or \
+            not np.array_equal(other.flavours, self.flavours):
+         raise ValueError('cannot merge histograms with different binning or flavours')
+      for disc, counts in other.counts.items():
+         if disc in self.counts:
+            self.counts[disc] += counts
+         else:
+            self.counts[disc] = counts.copy()
+      return self
+
+   def flavour_counts(self, disc, flavour):
+      'counts of flavour, (eta cell, phi cell, score bin)'
+      return self.counts[disc][np.searchsorted(self.flavours, flavour)]
+
+   def scan(self, disc, signal, background, mistag, weta, wphi):
+      '''efficiency and mistag rate, at the inclusive working point of the given mistag
+      rate, of every window of weta x wphi cells, with their deviations from the
+      inclusive values in units of the binomial uncertainty of the window'''
+      sig = self.flavour_counts(disc, signal)
+      bkg = self.flavour_counts(disc, background)
+      #loosest bin edge keeping the inclusive mistag rate within mistag
+      bkg_above = np.cumsum(bkg.sum(axis=(0, 1))[::-1])[::-1]
+      first_bin = np.argmax(bkg_above <= mistag * bkg_above[0])
+      result = {
+         'threshold' : self.bin_edges()[first_bin],
+         'eta_low' : self.eta_low + self.eta_cell * np.arange(self.neta - weta + 1),
+         'phi_low' : -np.pi + self.phi_cell * np.arange(self.nphi),
+         'eta_cells' : weta,
+         'phi_cells' : wphi,
+         'eta_width' : weta * self.eta_cell,
+         'phi_width' : wphi * self.phi_cell,
+         }
+      for name, counts in [('signal', sig), ('background', bkg)]:
+         total = window_sums(counts.sum(axis=2), weta, wphi)
+         passed = window_sums(counts[:, :, first_bin:].sum(axis=2), weta, wphi)
+         inclusive = counts[:, :, first_bin:].sum() / float(max(counts.sum(), 1))
+         fraction = passed / np.maximum(total, 1).astype(float)
+         sigma = np.sqrt(inclusive * (1 - inclusive) / np.maximum(total, 1))
+         with np.errstate(divide='ignore', invalid='ignore'):
+            pull = (fraction - inclusive) / sigma
+         result['n_%s' % name] = total
+         result['inclusive_%s' % name] = inclusive
+         result['%s_fraction' % name] = fraction
+         result['%s_pull' % name] = np.where((total > 0) & (sigma > 0), pull, 0.)
+      return result
+
+def rank_windows(scan, top=10):
+   '''the top windows by largest efficiency or mistag pull, skipping those overlapping
+   a window already ranked higher so that each problem is reported once.
+   phi_high is above pi for the windows wrapping around'''
+   pull = np.maximum(np.abs(scan['signal_pull']), np.abs(scan['background_pull']))
+   nphi = pull.shape[1]
+   weta, wphi = scan['eta_cells'], scan['phi_cells']
+   chosen = []
+   for flat in np.argsort(-pull, axis=None, kind='mergesort'):
+      ieta, iphi = divmod(int(flat), nphi)
+      overlaps = any(
+         abs(ieta - other_eta) < weta and min((iphi - other_phi) % nphi, (other_phi - iphi) % nphi) < wphi
+         for other_eta, other_phi in chosen
+         )
+      if not overlaps:
+         chosen.append((ieta, iphi))
+         if len(chosen) == top:
+            break
+   return [
+      {
+         'eta_low' : float(scan['eta_low'][ieta]),
+         'eta_high' : float(scan['eta_low'][ieta] + scan['eta_width']),
+         'phi_low' : float(scan['phi_low'][iphi]),
+         'phi_high' : float(scan['phi_low'][iphi] + scan['phi_width']),
+         'n_signal' : int(scan['n_signal'][ieta, iphi]),
+         'n_background' : int(scan['n_background'][ieta, iphi]),
+         'efficiency' : float(scan['signal_fraction'][ieta, iphi]),
+         'mistag' : float(scan['background_fraction'][ieta, iphi]),
+         'efficiency_pull' : float(scan['signal_pull'][ieta, iphi]),
+         'mistag_pull' : float(scan['background_pull'][ieta, iphi]),
+         }
+      for ieta, iphi in chosen
+      ]
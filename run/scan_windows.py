@@ -0,0 +1,114 @@
+#! /bin/env python
+'''scans every eta-phi window of a given size for a local change of the b-tagging
+efficiency or mistag rate at a fixed working point, in a single pass over the trees:
+the selected jets are counted in fine eta-phi cells per flavour and score bin and
+every window is summed from summed-area tables, instead of running make_rocs.py
+once per guessed window'''
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+import csv
+import json
+import os
+import numpy as np
+from argparse import ArgumentParser
+from tree_utils import expand_inputs, iterate_tree, default_cache_dir, needed_branches
+from plan_utils import Plan, DEFAULT_PLAN
+from pool_utils import TaskPool
+from scan_utils import EtaPhiHistograms, rank_windows
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument('infiles', nargs='+',
+                    help='input trees: paths, glob patterns or .txt files listing one path per line')
+parser.add_argument('outdir')
+parser.add_argument('--plan', default=DEFAULT_PLAN, help='plan providing the jet selection and the discriminators')
+parser.add_argument('--discriminators', nargs='+', help='discriminators to scan, by default all those of the plan')
+parser.add_argument('--signal', type=int, default=5, help='flavour whose efficiency is scanned')
+parser.add_argument('--background', type=int, default=0, help='flavour defining the working point mistag rate')
+parser.add_argument('--mistag', type=float, default=0.01, help='inclusive mistag rate of the working point')
+parser.add_argument('--cell', type=float, default=0.1, help='size of the eta and phi cells')
+parser.add_argument('--eta-range', type=float, nargs=2, default=[-2.5, 2.5])
+parser.add_argument('--window', type=float, nargs=2, default=[1.0, 1.2], metavar=('ETA', 'PHI'),
+                    help='size of the windows scanned, by default that of the HEM 15/16 one')
+parser.add_argument('--bins', type=int, default=200, help='number of score bins, the working point threshold is a bin edge')
+parser.add_argument('--top', type=int, default=10, help='number of windows reported')
+parser.add_argument('--max-memory', type=int, default=256,
+                    help='maximum size, in MB, of each chunk of the tree read at once')
+parser.add_argument('--cache-dir', help='directory of the columnar caches of the trees, by default next to each input when writable')
+parser.add_argument('--no-cache', action='store_true', help='always read the ROOT file, without caching it')
+parser.add_argument('--jobs', type=int, default=1, help='number of worker processes reading the files')
+
+def file_histograms(infile, args):
+   'eta-phi histograms of the selected jets of one input file'
+   histograms = EtaPhiHistograms(
+      args.discriminators, (args.signal, args.background), args.cell, args.eta_range, args.bins
+      )
+   branches = needed_branches(args.plan.branches(args.discriminators), ['jet_eta', 'jet_phi'])
+   cache_dir = None if args.no_cache else default_cache_dir(infile, args.cache_dir)
+   for chunk in iterate_tree(infile, branches=branches, max_memory=args.max_memory*2**20, cache_dir=cache_dir):
+      histograms.fill(chunk, args.plan.select(chunk))
+   return histograms
+
+def plot_pulls(scan, disc, args):
+   'map of the efficiency pull of every window, placed at its centre'
+   eta = scan['eta_low'] + scan['eta_width'] / 2.
+   phi = scan['phi_low'] + scan['phi_width'] / 2.
+   phi = np.where(phi >= np.pi, phi - 2*np.pi, phi)
+   order = np.argsort(phi)
+   eta_cell = scan['eta_width'] / scan['eta_cells']
+   phi_cell = scan['phi_width'] / scan['phi_cells']
+   eta_edges = np.r_[eta - eta_cell / 2., eta[-1] + eta_cell / 2.]
+   phi_edges = np.r_[phi[order] - phi_cell / 2., phi[order][-1] + phi_cell / 2.]
+   limit = max(np.abs(scan['signal_pull']).max(), 1.)
+   plt.pcolormesh(eta_edges, phi_edges, scan['signal_pull'][:, order].T, cmap='RdBu', vmin=-limit, vmax=limit)
+   plt.colorbar().set_label('efficiency pull of the window')
+   plt.xlabel('window centre $\\eta$')
+   plt.ylabel('window centre $\\phi$')
+   plt.title('%s, %g%% mistag working point (score > %.3f)' % (disc, 100*args.mistag, scan['threshold']))
+   plt.savefig('%s/scan_%s.png' % (args.outdir, disc))
+   plt.savefig('%s/scan_%s.pdf' % (args.outdir, disc))
+   plt.clf()
+
+if __name__ == '__main__':
+   args = parser.parse_args()
+   args.infiles = expand_inputs(args.infiles)
+   if not args.infiles:
+      parser.error('no input files found')
+   args.plan = Plan.load(args.plan)
+   args.discriminators = args.discriminators or list(args.plan.discriminators)
+   if not os.path.isdir(args.outdir):
+      os.makedirs(args.outdir)
+
+   #each file is merged as soon as its histograms are filled
+   histograms = None
+   with TaskPool(jobs=min(args.jobs, len(args.infiles))) as pool:
+      for _, partial in pool.imap_unordered(file_histograms, [(infile, args) for infile in args.infiles]):
+         histograms = partial if histograms is None else histograms.merge(partial)
+
+   weta = int(round(args.window[0] / histograms.eta_cell))
+   wphi = int(round(args.window[1] / histograms.phi_cell))
+   rows = []
+   for disc in args.discriminators:
+      scan = histograms.scan(disc, args.signal, args.background, args.mistag, weta, wphi)
+      print '%s: threshold %.3f, inclusive efficiency %.3f and mistag rate %.4f' % (
+         disc, scan['threshold'], scan['inclusive_signal'], scan['inclusive_background'])
+      for window in rank_windows(scan, args.top):
+         print '   eta [%5.2f, %5.2f] phi [%5.2f, %5.2f]: efficiency %.3f (%+.1f sigma), mistag %.4f (%+.1f sigma)' % (
+            window['eta_low'], window['eta_high'], window['phi_low'], window['phi_high'],
+            window['efficiency'], window['efficiency_pull'], window['mistag'], window['mistag_pull'])
+         window['discriminator'] = disc
+         window['threshold'] = float(scan['threshold'])
+         rows.append(window)
+      plot_pulls(scan, disc, args)
+
+   columns = [
+      'discriminator', 'threshold', 'eta_low', 'eta_high', 'phi_low', 'phi_high', 'n_signal', 'n_background',
+      'efficiency', 'efficiency_pull', 'mistag', 'mistag_pull',
+      ]
+   with open('%s/windows.json' % args.outdir, 'w') as output:
+      json.dump(rows, output, indent=2, sort_keys=True)
+   with open('%s/windows.csv' % args.outdir, 'w') as output:
+      writer = csv.DictWriter(output, columns)
+      writer.writeheader()
+      writer.writerows(rows)
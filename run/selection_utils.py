@@ -0,0 +1,108 @@
+import ast
+import numpy as np
+try:
+   import numexpr
+except ImportError:
+   numexpr = None
+
+#rows evaluated at once by the NumPy fallback, small enough for the temporaries to stay in cache
+BLOCK_SIZE = 2**16
+
+#functions allowed in the selection expressions
+FUNCTIONS = {
+   'abs' : np.abs, 'sqrt' : np.sqrt, 'exp' : np.exp, 'log' : np.log,
+   'sin' : np.sin, 'cos' : np.cos, 'tan' : np.tan, 'arctan2' : np.arctan2,
+}
+#names the NumPy fallback evaluates the expressions with, without any builtins: True and
+#False are names rather than literals in Python 2, NumPy booleans so that ~ negates them
+NAMESPACE = dict(FUNCTIONS, __builtins__={})
+NAMESPACE.update({'True' : np.True_, 'False' : np.False_})
+OPERATORS = {
+   ast.Add : '+', ast.Sub : '-', ast.Mult : '*', ast.Div : '/', ast.Pow : '**', ast.Mod : '%',
+   ast.Lt : '<', ast.LtE : '<=', ast.Gt : '>', ast.GtE : '>=', ast.Eq : '==', ast.NotEq : '!=',
+   ast.And : '&', ast.Or : '|', ast.Not : '~', ast.USub : '-', ast.UAdd : '+',
+}
+
+class Expression(object):
+   '''a selection expression such as "-2.5 < jet_eta < -1.5 and -1.8 < jet_phi < -0.6",
+   compiled once into elementwise array code: chained comparisons become &, and/or/not
+   become &, |, ~. It is evaluated by numexpr, multithreaded and without full-length
+   temporaries, when installed and running more than one thread, otherwise by NumPy
+   in blocks of BLOCK_SIZE rows, which is faster than a single numexpr thread'''
+   def __init__(self, text):
+      self.text = text
+      self.branches = []
+      self.source = self.translate(ast.parse(text.strip(), mode='eval').body)
+      self.code = compile(self.source, '<selection>', 'eval')
+
+   def translate(self, node):
+      'array code of an expression node, recording the branches it reads'
+      if isinstance(node, ast.BoolOp):
+         return '(%s)' % (' %s ' % OPERATORS[type(node.op)]).join(self.translate(value) for value in node.values)
+      elif isinstance(node, ast.Compare):
+         operands = [self.translate(node.left)] + [self.translate(comparator) for comparator in node.comparators]
+         return '(%s)' % ' & '.join(
+            '(%s %s %s)' % (left, OPERATORS[type(op)], right)
+            for left, op, right in zip(operands[:-1], node.ops, operands[1:])
+            )
+      elif isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+         return '(%s %s %s)' % (self.translate(node.left), OPERATORS[type(node.op)], self.translate(node.right))
+      elif isinstance(node, ast.UnaryOp) and type(node.op) in OPERATORS:
+         return '%s(%s)' % (OPERATORS[type(node.op)], self.translate(node.operand))
+      elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and \
+            node.func.id in FUNCTIONS and not node.keywords:
+         return '%s(%s)' % (node.func.id, ', '.join(self.translate(arg) for arg in node.args))
+      elif isinstance(node, ast.Name) and node.id in ('True', 'False'):
+         return node.id
+      elif isinstance(node, ast.Name):
+         if node.id not in self.branches:
+            self.branches.append(node.id)
+         return node.id
+      elif type(node).__name__ in ('Num', 'Constant', 'NameConstant'):
+         value = getattr(node, 'n', getattr(node, 'value', None))
+         if isinstance(value, (bool, int, float)):
+            return repr(value)
+      raise ValueError('unsupported selection expression: %s' % self.text)
+
+   def evaluate(self, columns):
+      'boolean mask of the expression over a dictionary of equally long columns'
+      variables = dict((branch, columns[branch]) for branch in self.branches)
+      size = len(columns[self.branches[0]] if self.branches else next(iter(columns.values())))
+      if not self.branches:
+         #a constant, e.g. True
+         return np.full(size, eval(self.code, NAMESPACE, {}), dtype=bool)
+      if numexpr is not None and numexpr.nthreads > 1:
+         return np.asarray(numexpr.evaluate(self.source, local_dict=variables), dtype=bool)
+      mask = np.empty(size, dtype=bool)
+      for start in range(0, size, BLOCK_SIZE):
+         block = dict((branch, column[start:start + BLOCK_SIZE]) for branch, column in variables.items())
+         mask[start:start + BLOCK_SIZE] = eval(self.code, NAMESPACE, block)
+      return mask
+
+#compiled expressions, by text
+_expressions = {}
+
+def compile_expression(text):
+   'the compiled Expression of text, each distinct text is compiled only once'
+   if text not in _expressions:
+      _expressions[text] = Expression(text)
+   return _expressions[text]
+
+def evaluate(text, columns):
+   return compile_expression(text).evaluate(columns)
+
+class MaskIndex(object):
+   '''integer indices of the jets of each region having one of the flavours,
+   built once per run and shared by every discriminator and flavour pair.
+   Regions are boolean masks over the selected jets, None stands for all of them'''
+   def __init__(self, flavour, regions, flavours):
+      known = np.in1d(flavour, flavours)
+      dtype = np.int32 if flavour.size < 2**31 else np.int64
+      self.indices = dict(
+         (region, np.flatnonzero(known if mask is None else known & mask).astype(dtype))
+         for region, mask in regions.items()
+         )
+
+   def arrays(self):
+      '''all index arrays, keyed by ('index', region)'''
+      return dict((('index', region), index) for region, index in self.indices.items())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+#the helper modules are imported as plain modules, as the scripts next to them do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
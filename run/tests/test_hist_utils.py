@@ -0,0 +1,17 @@
+'''the score bin of each jet, for the compact float32 scores, is the one its bin
+edges give, so that the approximate ROCs are exact at the edges'''
+import numpy as np
+import pytest
+from hist_utils import ScoreHistograms
+from scan_utils import EtaPhiHistograms
+
+@pytest.mark.parametrize('histograms', [
+   ScoreHistograms(['disc'], ['FULL']),
+   ScoreHistograms(['disc'], ['FULL'], nbins=1000, low=-0.1, high=0.9),
+   EtaPhiHistograms(['disc']),
+   ], ids=['ScoreHistograms', 'ScoreHistograms (shifted)', 'EtaPhiHistograms'])
+def test_bin_index_matches_bin_edges(histograms):
+   rng = np.random.RandomState(5)
+   scores = np.r_[rng.rand(10**6), -1., histograms.low, histograms.high, 2.].astype(np.float32)
+   expected = np.searchsorted(histograms.bin_edges(), scores.astype(np.float64), side='right') - 1
+   np.testing.assert_array_equal(histograms.bin_index(scores), expected)
@@ -0,0 +1,65 @@
+'''the loop (compiled when numba is installed) and the NumPy version of each kernel
+agree bit for bit, on random samples with ties'''
+import numpy as np
+import pytest
+import kernel_utils
+from kernel_utils import _run_ends_loop, _run_ends_numpy, _weighted_counts_loop, _weighted_counts_numpy, \
+   _grid_segments_loop, _grid_segments_numpy
+
+def kernel_cases(size=10**5, seed=0):
+   'name, arguments, loop and NumPy version of each kernel'
+   rng = np.random.RandomState(seed)
+   scores = np.sort(np.round(rng.rand(size), 3))[::-1]
+   y_true = rng.rand(size) < 0.3
+   thresholds = _run_ends_numpy(scores)
+   #a curve with repeated values, some of them also on the grid, and one with only two
+   grid = np.r_[-0.5, np.logspace(-4, 0, 80), 1.5]
+   fpr = np.sort(np.r_[np.round(rng.rand(1000), 3), grid[1:-1], grid[1:-1]])
+   cases = [
+      ('run_ends', (scores,), _run_ends_loop, _run_ends_numpy),
+      ('run_ends (empty)', (scores[:0],), _run_ends_loop, _run_ends_numpy),
+      ('grid_segments', (fpr, grid), _grid_segments_loop, _grid_segments_numpy),
+      ('grid_segments (two values)', (np.array([0., 0., 1., 1.]), grid), _grid_segments_loop, _grid_segments_numpy),
+      ]
+   for weights in [rng.poisson(1., size), rng.rand(size), rng.rand(size).astype(np.float32)]:
+      cases.append((
+         'weighted_counts (%s)' % weights.dtype, (y_true, thresholds, weights),
+         _weighted_counts_loop, _weighted_counts_numpy
+         ))
+   return cases
+
+def loop_versions(loop):
+   'the loop as run by the Python interpreter and, with numba, compiled'
+   versions = [getattr(loop, 'py_func', loop)]
+   if kernel_utils.numba is not None:
+      versions.append(loop)
+   return versions
+
+@pytest.mark.parametrize('name, arguments, loop, vectorized', kernel_cases(), ids=[case[0] for case in kernel_cases()])
+def test_loop_matches_numpy(name, arguments, loop, vectorized):
+   expected = vectorized(*arguments)
+   if not isinstance(expected, tuple):
+      expected = (expected,)
+   for version in loop_versions(loop):
+      result = version(*arguments)
+      if not isinstance(result, tuple):
+         result = (result,)
+      for a, b in zip(expected, result):
+         assert a.dtype == b.dtype
+         assert np.array_equal(a, b)
+
+def test_compile_error_falls_back_to_numpy(monkeypatch):
+   'a loop numba cannot compile is replaced by the NumPy version, for good'
+   class CompileError(Exception):
+      pass
+   calls = []
+   def loop(values):
+      calls.append(values)
+      raise CompileError('cannot type the loop')
+   monkeypatch.setattr(kernel_utils, 'numba', object())
+   monkeypatch.setattr(kernel_utils, 'NumbaError', CompileError, raising=False)
+   monkeypatch.setattr(kernel_utils, '_failed', set())
+   values = np.array([3., 3., 2., 1., 1.])
+   for _ in range(2):
+      assert np.array_equal(kernel_utils.run_kernel(loop, _run_ends_numpy, values), [1, 2, 4])
+   assert len(calls) == 1
@@ -0,0 +1,153 @@
+'''the ROCs computed from one sort per region, from merged score runs and from
+reweighted replicas against sklearn's roc_curve on the float64 scores, with the
+compact float32 scores and uint8 flavour the ROC path keeps'''
+import numpy as np
+import pytest
+from roc_utils import sort_scores, roc_counts, counts_roc, weighted_roc, bootstrap_weights, bootstrap_replicas, \
+   delong_auc, counted_roc, flavour_counts, pair_counts, region_rocs, grouped_rocs, ScoreRuns
+from selection_utils import MaskIndex
+
+metrics = pytest.importorskip('sklearn.metrics')
+
+PAIRS = [(5, 0), (5, 4), (4, 0)]
+FLAVOURS = [0, 4, 5]
+
+@pytest.fixture(scope='module')
+def jets():
+   '''flavour, float32 scores rounded to have ties, with tagger default values,
+   a region mask and a bin number'''
+   rng = np.random.RandomState(3)
+   size = 20000
+   flavour = rng.choice(FLAVOURS, size, p=[0.6, 0.15, 0.25]).astype(np.uint8)
+   scores = np.clip(rng.normal(0.2 + 0.12*flavour, 0.25), 0, 1)
+   scores[rng.rand(size) < 0.02] = -1.
+   return {
+      'flavour' : flavour,
+      'disc' : np.round(scores, 3).astype(np.float32),
+      'region' : rng.rand(size) < 0.4,
+      'bin' : rng.randint(0, 4, size).astype(np.int32),
+      }
+
+def reference_roc(jets, signal, background, mask=None, drop_intermediate=True):
+   'fpr and tpr of roc_curve on the float64 scores of the pair'
+   in_pair = (jets['flavour'] == signal) | (jets['flavour'] == background)
+   if mask is not None:
+      in_pair &= mask
+   fpr, tpr, _ = metrics.roc_curve(
+      jets['flavour'][in_pair] == signal, jets['disc'][in_pair].astype(np.float64),
+      drop_intermediate=drop_intermediate
+      )
+   return fpr, tpr
+
+@pytest.mark.parametrize('region', ['FULL', 'region'])
+def test_region_rocs_match_roc_curve(jets, region):
+   regions = {'FULL' : None, 'region' : jets['region']}
+   columns = {'disc' : jets['disc'], 'flavour' : jets['flavour']}
+   columns.update(MaskIndex(jets['flavour'], regions, FLAVOURS).arrays())
+   rocs, _ = region_rocs(columns, 'disc', region, PAIRS)
+   for (signal, background), roc in zip(PAIRS, rocs):
+      fpr, tpr = reference_roc(jets, signal, background, regions[region])
+      np.testing.assert_array_equal(roc[0], fpr)
+      np.testing.assert_array_equal(roc[1], tpr)
+
+def test_score_runs_match_roc_curve(jets):
+   'ScoreRuns filled in chunks, as from several files, and merged'
+   regions = {'FULL' : None, 'region' : jets['region']}
+   merged = None
+   for chunk in np.array_split(np.arange(jets['flavour'].size), 3):
+      partial = ScoreRuns(['disc'], list(regions), FLAVOURS)
+      chunk_columns = dict((name, values[chunk]) for name, values in jets.items())
+      partial.fill(chunk_columns, np.ones(chunk.size, dtype=bool), {'FULL' : None, 'region' : chunk_columns['region']})
+      merged = partial if merged is None else merged.merge(partial)
+   for region, mask in regions.items():
+      for signal, background in PAIRS:
+         fpr, tpr, _ = merged.roc('disc', region, signal, background)
+         expected_fpr, expected_tpr = reference_roc(jets, signal, background, mask, drop_intermediate=False)
+         np.testing.assert_array_equal(fpr, expected_fpr)
+         np.testing.assert_array_equal(tpr, expected_tpr)
+
+def test_score_runs_subtract(jets):
+   'subtracting a merged partial gives back the runs of the others'
+   partials = []
+   for chunk in np.array_split(np.arange(jets['flavour'].size), 2):
+      partial = ScoreRuns(['disc'], ['FULL'], FLAVOURS)
+      partial.fill(dict((name, values[chunk]) for name, values in jets.items()), np.ones(chunk.size, dtype=bool), {'FULL' : None})
+      partials.append(partial.sort())
+   merged = ScoreRuns(['disc'], ['FULL'], FLAVOURS).merge(partials[0]).merge(partials[1])
+   merged.subtract(partials[1])
+   for flavour in FLAVOURS:
+      np.testing.assert_array_equal(merged.scores('disc', 'FULL', flavour), partials[0].scores('disc', 'FULL', flavour))
+
+def test_counted_roc_matches_roc_curve(jets):
+   'curve, analytic AUC and working points from the counts of roc_counts'
+   in_pair = (jets['flavour'] == 5) | (jets['flavour'] == 0)
+   true, scores = jets['flavour'][in_pair] == 5, jets['disc'][in_pair]
+   fpr, tpr = counted_roc(roc_counts(true, scores))[:2]
+   expected_fpr, expected_tpr, _ = metrics.roc_curve(true, scores.astype(np.float64))
+   np.testing.assert_array_equal(fpr, expected_fpr)
+   np.testing.assert_array_equal(tpr, expected_tpr)
+   _, _, _, _, auc, table = counted_roc(roc_counts(true, scores), 'analytic', mistags=[0.1, 0.01])
+   np.testing.assert_allclose(auc[0], metrics.roc_auc_score(true, scores.astype(np.float64)), rtol=1e-12)
+   #the working point is the last point of the full curve within the mistag rate
+   full_fpr, full_tpr, full_thresholds = metrics.roc_curve(true, scores.astype(np.float64), drop_intermediate=False)
+   for mistag, threshold, efficiency, actual, _ in table:
+      index = np.searchsorted(full_fpr, mistag, side='right') - 1
+      assert (threshold, efficiency, actual) == (full_thresholds[index], full_tpr[index], full_fpr[index])
+
+@pytest.mark.parametrize('uncertainty', [None, 'analytic', 'bootstrap'])
+def test_counted_roc_of_empty_pair(jets, uncertainty):
+   'a region without jets of the pair gives a degenerate curve and nan working points'
+   true, scores = jets['flavour'][:0] == 5, jets['disc'][:0]
+   y_true, _, thresholds = sort_scores(true, scores)
+   replicas = bootstrap_replicas(y_true, thresholds, n_boots=3)
+   result = counted_roc(roc_counts(true, scores), uncertainty, mistags=[0.1, 0.01], replicas=replicas)
+   assert np.all(np.isnan(result[-1][:, 1:]))
+   if uncertainty == 'analytic':
+      assert np.all(np.isnan(result[4]))
+
+def test_reweighting_matches_resampling(jets):
+   '''a bootstrap replica reweighting the sorted sample is the ROC of the sample
+   resampled with replacement with the same draws'''
+   true, scores = jets['flavour'] == 5, jets['disc']
+   rng = np.random.RandomState(7)
+   weights = bootstrap_weights(scores.size, 'multinomial', rng)
+   y_true, _, thresholds = sort_scores(true, scores)
+   order = np.argsort(scores, kind='mergesort')[::-1]
+   fakes, effs = weighted_roc(y_true, thresholds, weights[order])
+   #the thresholds of the jets not drawn repeat the previous point
+   kept = np.r_[True, (np.diff(fakes) != 0) | (np.diff(effs) != 0)]
+   resampled = np.repeat(np.arange(scores.size), weights)
+   fpr, tpr, _ = metrics.roc_curve(true[resampled], scores[resampled].astype(np.float64), drop_intermediate=False)
+   np.testing.assert_allclose(fakes[kept], fpr, rtol=1e-12)
+   np.testing.assert_allclose(effs[kept], tpr, rtol=1e-12)
+
+def test_pair_counts_match_roc_counts(jets):
+   'every pair from the cumulative counts of all the flavours of a region sorted once'
+   order = np.argsort(jets['disc'], kind='mergesort')[::-1]
+   scores, flavour = jets['disc'][order], jets['flavour'][order]
+   thresholds, counts = flavour_counts(scores, flavour, FLAVOURS)
+   for signal, background in PAIRS:
+      in_pair = (jets['flavour'] == signal) | (jets['flavour'] == background)
+      expected = roc_counts(jets['flavour'][in_pair] == signal, jets['disc'][in_pair])
+      for result, reference in zip(pair_counts(thresholds, counts, signal, background), expected):
+         np.testing.assert_array_equal(result, reference)
+
+def test_grouped_rocs_match_per_bin(jets):
+   'the ROC counts and DeLong AUC of every bin from a single lexsort'
+   rocs = grouped_rocs(jets['bin'], jets['disc'], jets['flavour'], PAIRS)
+   for signal, background in PAIRS:
+      ids, starts, thresholds, tps, fps, auc, auc_unc = rocs[signal, background]
+      ends = np.r_[starts[1:], thresholds.size]
+      for index, group in enumerate(ids):
+         in_bin = (jets['bin'] == group) & ((jets['flavour'] == signal) | (jets['flavour'] == background))
+         expected = roc_counts(jets['flavour'][in_bin] == signal, jets['disc'][in_bin])
+         segment = slice(starts[index], ends[index])
+         for result, reference in zip((thresholds[segment], tps[segment], fps[segment]), expected):
+            np.testing.assert_array_equal(result, reference)
+         np.testing.assert_allclose((auc[index], auc_unc[index]), delong_auc(*expected[1:]), rtol=1e-12)
+         fpr, tpr, _ = counts_roc(*expected)
+         expected_fpr, expected_tpr, _ = metrics.roc_curve(
+            jets['flavour'][in_bin] == signal, jets['disc'][in_bin].astype(np.float64), drop_intermediate=False
+            )
+         np.testing.assert_array_equal(fpr, expected_fpr)
+         np.testing.assert_array_equal(tpr, expected_tpr)
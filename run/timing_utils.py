@@ -0,0 +1,147 @@
+import json
+import os
+import resource
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+def cpu_time():
+   'user and system time of this process and of its terminated children'
+   return sum(os.times()[:4])
+
+def max_rss_mb(who=resource.RUSAGE_SELF):
+   '''largest resident memory of this process since its start, or with RUSAGE_CHILDREN
+   of its largest terminated child (e.g. a pool worker), ru_maxrss is in kB on Linux'''
+   return resource.getrusage(who).ru_maxrss / 1024.
+
+def peak_rss_mb():
+   '''peak resident memory of this process since the last reset_peak_rss, from VmHWM
+   in /proc/self/status on Linux, since the start of the process elsewhere'''
+   try:
+      with open('/proc/self/status') as status:
+         for line in status:
+            if line.startswith('VmHWM:'):
+               return int(line.split()[1]) / 1024.
+   except IOError:
+      pass
+   return max_rss_mb()
+
+def reset_peak_rss():
+   '''sets the peak resident memory back to the current one, through
+   /proc/self/clear_refs (Linux 4.0 and later), returns whether it could'''
+   try:
+      with open('/proc/self/clear_refs', 'w') as clear_refs:
+         clear_refs.write('5')
+      return True
+   except (IOError, OSError):
+      return False
+
+def new_record():
+   return {'wall' : 0., 'cpu' : 0., 'calls' : 0, 'peak_rss_mb' : 0., 'rss_growth_mb' : 0.}
+
+class StageTimer(object):
+   '''accumulates wall time, CPU time and memory in named stages, a stage can be
+   entered many times, e.g. once per chunk. The peak resident memory is reset
+   when a stage starts, so that its peak_rss_mb is reached during the stage
+   itself where the kernel allows it, rss_growth_mb is how much the stage
+   raised the peak of the whole run'''
+   def __init__(self):
+      self.stages = OrderedDict()
+      self.counters = OrderedDict()
+      self.start = time.time(), cpu_time()
+      #peak of the whole run and running peaks of the open stages, outermost first
+      self.peak = peak_rss_mb()
+      self.open = []
+      #whether a pool of worker processes ran, only then is the largest child peak theirs,
+      #otherwise it is that of helper processes started by the libraries at import
+      self.workers = False
+
+   def merge(self, stages, counters=None):
+      '''adds the records of another timer, e.g. one that ran in a worker process'''
+      for name, record in stages.items():
+         mine = self.stages.setdefault(name, new_record())
+         for field in ['wall', 'cpu', 'calls', 'rss_growth_mb']:
+            mine[field] += record[field]
+         mine['peak_rss_mb'] = max(mine['peak_rss_mb'], record['peak_rss_mb'])
+      for name, amount in (counters or {}).items():
+         self.count(name, amount)
+
+   def observe(self):
+      '''peak resident memory since the last reset, accounted to the open stages
+      and to the whole run before it is reset again'''
+      peak = peak_rss_mb()
+      self.open = [max(running, peak) for running in self.open]
+      self.peak = max(self.peak, peak)
+      return peak
+
+   def count(self, name, amount):
+      self.counters[name] = self.counters.get(name, 0) + amount
+
+   @contextmanager
+   def stage(self, name):
+      record = self.stages.setdefault(name, new_record())
+      wall, cpu = time.time(), cpu_time()
+      self.observe()
+      before = self.peak
+      reset_peak_rss()
+      self.open.append(0.)
+      try:
+         yield
+      finally:
+         record['wall'] += time.time() - wall
+         record['cpu'] += cpu_time() - cpu
+         record['calls'] += 1
+         peak = max(self.open.pop(), self.observe())
+         record['peak_rss_mb'] = max(record['peak_rss_mb'], peak)
+         record['rss_growth_mb'] += max(peak - before, 0.)
+
+   def iterate(self, name, iterable):
+      'yields from iterable, timing the production of each item as stage name'
+      iterator = iter(iterable)
+      while True:
+         with self.stage(name):
+            try:
+               item = next(iterator)
+            except StopIteration:
+               return
+         yield item
+
+   def report(self, rate_counter='jets'):
+      '''all stages, counters and the totals since creation, the rate is the
+      number of rate_counter items per second of wall time'''
+      wall = time.time() - self.start[0]
+      total = self.counters.get(rate_counter, 0)
+      return OrderedDict([
+         ('stages', self.stages),
+         ('counters', self.counters),
+         ('total', OrderedDict([
+            ('wall', wall),
+            ('cpu', cpu_time() - self.start[1]),
+            ('peak_rss_mb', max(self.peak, self.observe())),
+            ('workers_peak_rss_mb', max_rss_mb(resource.RUSAGE_CHILDREN) if self.workers else None),
+            ('%s_per_second' % rate_counter, total / wall if wall else None),
+            ])),
+         ])
+
+   def write(self, path, **extra):
+      report = self.report()
+      report.update(extra)
+      with open(path, 'w') as output:
+         json.dump(report, output, indent=2)
+      return report
+
+   def summary(self, rate_counter='jets'):
+      '''one line with the totals and the slowest stage'''
+      report = self.report(rate_counter)
+      total = report['total']
+      line = '%.1f s wall, %.1f s CPU, %.0f MB peak RSS' % (total['wall'], total['cpu'], total['peak_rss_mb'])
+      if total['workers_peak_rss_mb'] is not None:
+         line += ' (%.0f MB in the largest worker process)' % total['workers_peak_rss_mb']
+      if self.counters.get(rate_counter):
+         line = '%d %s in %s, %.0f %s/s' % (
+            self.counters[rate_counter], rate_counter, line,
+            total['%s_per_second' % rate_counter], rate_counter)
+      if self.stages:
+         name, record = max(self.stages.items(), key=lambda item: item[1]['wall'])
+         line += ', slowest stage %s (%.1f s)' % (name, record['wall'])
+      return line
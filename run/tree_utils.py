@@ -0,0 +1,187 @@
+import numpy as np
+from numpy.lib.format import open_memmap
+import glob
+import hashlib
+import json
+import os
+import shutil
+import ROOT
+import root_numpy
+
+TREE_NAME = 'bTaggingExerciseIIAK4Jets/tree'
+
+def needed_branches(*groups):
+   'union of the branches required by each group, in order of first appearance'
+   branches = []
+   for group in groups:
+      for branch in group:
+         if branch not in branches:
+            branches.append(branch)
+   return branches
+
+def open_tree(infile, treename=TREE_NAME):
+   tfile = ROOT.TFile.Open(infile)
+   if not tfile or tfile.IsZombie():
+      raise IOError('could not open %s' % infile)
+   tree = tfile.Get(treename)
+   if not tree:
+      raise IOError('could not find %s in %s' % (treename, infile))
+   return tfile, tree
+
+def branch_dtypes(tree, branches):
+   return root_numpy.tree2array(tree, branches=branches, start=0, stop=1).dtype
+
+def chunk_entries(row_size, max_memory):
+   'number of entries of row_size bytes that fit in max_memory bytes'
+   return max(1, int(max_memory) // row_size)
+
+def read_tree(infile, treename=TREE_NAME, branches=None, max_memory=256*2**20):
+   '''reads the tree in fixed-size entry ranges, yielding one dict of
+   branch arrays per range, so that at most max_memory bytes are read at once'''
+   tfile, tree = open_tree(infile, treename)
+   nentries = tree.GetEntries()
+   if nentries:
+      step = chunk_entries(branch_dtypes(tree, branches).itemsize, max_memory)
+      for start in range(0, nentries, step):
+         chunk = root_numpy.tree2array(tree, branches=branches, start=start, stop=start+step)
+         yield dict((name, chunk[name]) for name in chunk.dtype.names)
+   tfile.Close()
+
+def is_local(infile):
+   'whether infile is a file of the local filesystem, rather than e.g. a root:// URL'
+   return os.path.isfile(infile)
+
+def expand_inputs(patterns):
+   '''input files from paths, glob patterns and .txt files listing one path per line'''
+   infiles = []
+   for pattern in patterns:
+      if pattern.endswith('.txt'):
+         with open(pattern) as listing:
+            infiles += [line.strip() for line in listing if line.strip()]
+      else:
+         #patterns not matching local files, e.g. remote URLs, are kept as they are
+         infiles += sorted(glob.glob(pattern)) or [pattern]
+   return infiles
+
+def default_cache_dir(infile, cache_root=None):
+   '''cache directory of infile, next to it or, when cache_root is given,
+   in cache_root under a name unique to the full path of infile. None, meaning
+   reading the ROOT file directly, for remote inputs and when the directory of
+   the input is read-only (e.g. EOS or /store) and no cache_root is given'''
+   if not is_local(infile):
+      return None
+   if cache_root is None:
+      if not os.access(os.path.dirname(os.path.abspath(infile)), os.W_OK):
+         return None
+      return '%s.cache' % infile
+   path_hash = hashlib.sha1(os.path.abspath(infile).encode('utf-8')).hexdigest()[:12]
+   return os.path.join(cache_root, '%s.%s.cache' % (os.path.basename(infile), path_hash))
+
+def cache_key(infile, treename):
+   '''identifies the content of infile: its path, size and modification time,
+   the path alone for remote inputs which cannot be stat'ed'''
+   if not is_local(infile):
+      return {'path' : infile, 'tree' : treename}
+   stat = os.stat(infile)
+   return {
+      'path' : os.path.abspath(infile),
+      'tree' : treename,
+      'size' : stat.st_size,
+      'mtime' : stat.st_mtime,
+      }
+
+def fill_cache(infile, treename, branches, max_memory, cache_dir):
+   '''converts the branches to one .npy file each, written through memory maps
+   chunk by chunk and renamed in place only once complete'''
+   tfile, tree = open_tree(infile, treename)
+   nentries = tree.GetEntries()
+   dtypes = branch_dtypes(tree, branches)
+   tfile.Close()
+   paths = dict((branch, os.path.join(cache_dir, '%s.npy' % branch)) for branch in branches)
+   stores = dict(
+      (branch, open_memmap(paths[branch]+'.tmp', mode='w+', dtype=dtypes[branch], shape=(nentries,)))
+      for branch in branches
+      )
+   start = 0
+   for chunk in read_tree(infile, treename, branches, max_memory):
+      stop = start + chunk[branches[0]].shape[0]
+      for branch in branches:
+         stores[branch][start:stop] = chunk[branch]
+      start = stop
+   for store in stores.values():
+      store.flush()
+   del stores
+   for path in paths.values():
+      os.rename(path+'.tmp', path)
+
+def cached_columns(infile, treename=TREE_NAME, branches=None, max_memory=256*2**20, cache_dir=None):
+   '''memory maps of the branches from a per-branch .npy cache stored next to the input,
+   the cache is keyed on the input path, size and modification time and is rebuilt
+   when any of them changes, branches not yet cached are read once and added'''
+   cache_dir = cache_dir or default_cache_dir(infile)
+   if branches is None:
+      branches = root_numpy.list_branches(infile, treename)
+   key = cache_key(infile, treename)
+   meta_path = os.path.join(cache_dir, 'cache.json')
+   meta = {}
+   if os.path.isfile(meta_path):
+      with open(meta_path) as meta_file:
+         meta = json.load(meta_file)
+   if meta.get('key') != key:
+      if os.path.isdir(cache_dir):
+         shutil.rmtree(cache_dir)
+      meta = {'key' : key, 'branches' : []}
+   if not os.path.isdir(cache_dir):
+      os.makedirs(cache_dir)
+
+   missing = [branch for branch in branches if branch not in meta['branches']]
+   if missing:
+      fill_cache(infile, treename, missing, max_memory, cache_dir)
+      meta['branches'] += missing
+      with open(meta_path+'.tmp', 'w') as meta_file:
+         json.dump(meta, meta_file)
+      os.rename(meta_path+'.tmp', meta_path)
+
+   return dict(
+      (branch, np.load(os.path.join(cache_dir, '%s.npy' % branch), mmap_mode='r'))
+      for branch in branches
+      )
+
+def iterate_tree(infile, treename=TREE_NAME, branches=None, max_memory=256*2**20, cache_dir=None):
+   '''yields the tree in chunks of at most max_memory bytes, from the columnar
+   cache in cache_dir if given, straight from the ROOT file otherwise or when
+   the cache cannot be written'''
+   columns = None
+   if cache_dir is not None:
+      try:
+         columns = cached_columns(infile, treename, branches, max_memory, cache_dir)
+      except (IOError, OSError) as error:
+         print 'cannot cache %s in %s (%s), reading it directly' % (infile, cache_dir, error)
+   if columns is None:
+      for chunk in read_tree(infile, treename, branches, max_memory):
+         yield chunk
+      return
+   nentries = min(column.shape[0] for column in columns.values())
+   step = chunk_entries(sum(column.dtype.itemsize for column in columns.values()), max_memory)
+   for start in range(0, nentries, step):
+      yield dict((branch, column[start:start+step]) for branch, column in columns.items())
+
+class ColumnAccumulator(object):
+   '''collects the selected rows of a stream of chunks into contiguous columns,
+   stored with the given dtypes when narrower than the branches'''
+   def __init__(self, columns, dtypes=None):
+      self.parts = dict((column, []) for column in columns)
+      self.dtypes = dtypes or {}
+
+   def fill(self, chunk, mask):
+      for column, parts in self.parts.items():
+         values = chunk[column][mask]
+         if column in self.dtypes:
+            values = values.astype(self.dtypes[column])
+         parts.append(values)
+
+   def columns(self):
+      return dict(
+         (column, np.concatenate(parts) if parts else np.array([], dtype=self.dtypes.get(column, float)))
+         for column, parts in self.parts.items()
+         )